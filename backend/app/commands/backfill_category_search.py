@@ -0,0 +1,15 @@
+# Rellena name_lower en las categorías creadas antes de la búsqueda por nombre.
+# Reanudable: solo toca documentos sin name_lower. La API también lo hace al
+# arrancar; este comando sirve para lanzarlo a mano sin reiniciar.
+# Uso (desde backend/): python -m app.commands.backfill_category_search
+import asyncio
+from app.crud import backfill_name_lower
+
+
+async def main():
+    updated = await backfill_name_lower()
+    print(f"Categorías actualizadas: {updated}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
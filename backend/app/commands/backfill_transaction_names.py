@@ -0,0 +1,73 @@
+# Rellena username y category_name en transacciones anteriores a la desnormalización.
+# Es reanudable: por defecto solo procesa documentos a los que les falta algún
+# nombre (ausente o nulo). Con --all repasa todas (p. ej. tras renombrar usuarios en Postgres,
+# que este servicio no ve). Al terminar reconstruye transaction_rollups para
+# que /stats tenga también los nombres.
+# Uso (desde backend/): python -m app.commands.backfill_transaction_names [--all] [tamaño_lote]
+import asyncio
+import sys
+from pymongo import UpdateOne
+from app.core.category_names import category_names
+from app.core.user_directory import user_directory
+from app.crud import transactions_collection, rebuild_rollups, change_time
+
+ADMIN = {"role": "admin"}
+
+
+async def backfill(batch_size: int = 1000, refresh_all: bool = False):
+    updated = 0
+    last_id = None
+
+    while True:
+        query = {} if refresh_all else {"$or": [
+            # None casa tanto campos ausentes como nulos (usuario/categoría sin resolver)
+            {"username": None},
+            {"category_name": None},
+        ]}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await transactions_collection().find(
+            query, {"user_id": 1, "category_id": 1, "username": 1, "category_name": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        user_map = await user_directory.get_usernames({tx["user_id"] for tx in batch})
+        category_map = await category_names.get_names({tx["category_id"] for tx in batch}, ADMIN)
+        ops = []
+        # updated_at: los clientes de /transactions/changes reciben los nombres nuevos
+        updated_at = change_time()
+        for tx in batch:
+            names = {
+                "username": user_map.get(str(tx["user_id"])),
+                "category_name": category_map.get(str(tx["category_id"])),
+            }
+            if any(tx.get(field, ...) != value for field, value in names.items()):
+                ops.append(UpdateOne({"_id": tx["_id"]}, {"$set": {**names, "updated_at": updated_at}}))
+        if ops:
+            result = await transactions_collection().bulk_write(ops, ordered=False)
+            updated += result.modified_count
+
+        last_id = batch[-1]["_id"]
+        print(f"Actualizadas {updated} transacciones (último _id {last_id})")
+
+    return updated
+
+
+async def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--all"]
+    batch_size = int(args[0]) if args else 1000
+    await user_directory.connect()
+    if user_directory.pool is None:
+        # Sin Postgres todos los usernames quedarían vacíos
+        sys.exit("No se puede conectar a Postgres")
+    try:
+        updated = await backfill(batch_size, refresh_all="--all" in sys.argv)
+    finally:
+        await user_directory.close()
+    buckets = await rebuild_rollups()
+    print(f"Backfill terminado: {updated} transacciones, {buckets} cubos de rollups")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+# Comprueba con explain() que las consultas calientes usan índice.
+# Sale con código 1 si alguna acaba en COLLSCAN (apto para CI).
+# Uso (desde backend/): python -m app.commands.check_indexes
+import asyncio
+import sys
+from app.db import get_db
+from app.indexes import ensure_indexes, find_collscans
+
+
+async def main():
+    db = get_db()
+    await ensure_indexes(db)
+    regressions = await find_collscans(db)
+    for collection, query, sort in regressions:
+        print(f"COLLSCAN en {collection}: filtro={query} orden={sort}")
+    if regressions:
+        sys.exit(1)
+    print("Todas las consultas calientes usan índice")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+# Convierte transactions.category_id de string a ObjectId por lotes.
+# Es reanudable: solo procesa documentos cuyo category_id sigue siendo string,
+# así que puede interrumpirse y relanzarse sin repetir trabajo.
+# Al terminar reconstruye transaction_rollups (sus claves usaban el string).
+# Uso (desde backend/): python -m app.commands.migrate_category_ids [tamaño_lote]
+import asyncio
+import sys
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.crud import transactions_collection, rebuild_rollups, change_time
+
+
+async def migrate(batch_size: int = 1000):
+    migrated = 0
+    invalid = 0
+    last_id = None
+
+    while True:
+        query = {"category_id": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await transactions_collection().find(
+            query, {"category_id": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        ops = []
+        # updated_at: cuenta como cambio para /transactions/changes
+        updated_at = change_time()
+        for tx in batch:
+            if ObjectId.is_valid(tx["category_id"]):
+                ops.append(UpdateOne(
+                    {"_id": tx["_id"], "category_id": tx["category_id"]},
+                    {"$set": {"category_id": ObjectId(tx["category_id"]), "updated_at": updated_at}}
+                ))
+            else:
+                invalid += 1
+                print(f"category_id no válido en {tx['_id']}: {tx['category_id']!r}")
+        if ops:
+            result = await transactions_collection().bulk_write(ops, ordered=False)
+            migrated += result.modified_count
+
+        last_id = batch[-1]["_id"]
+        print(f"Migradas {migrated} transacciones (último _id {last_id})")
+
+    return migrated, invalid
+
+
+async def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    migrated, invalid = await migrate(batch_size)
+    buckets = await rebuild_rollups()
+    print(f"Migración terminada: {migrated} convertidas, {invalid} sin convertir, {buckets} cubos de rollups")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,15 @@
+# Reconstruye la colección transaction_rollups a partir de transactions.
+# Lanzarlo sin escrituras en curso: los cambios que lleguen durante el
+# recálculo se pierden al sustituir la colección ($out).
+# Uso (desde backend/): python -m app.commands.rebuild_rollups
+import asyncio
+from app.crud import rebuild_rollups
+
+
+async def main():
+    buckets = await rebuild_rollups()
+    print(f"Rollups reconstruidos: {buckets} cubos")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
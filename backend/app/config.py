@@ -7,12 +7,54 @@ class Settings(BaseSettings):
     mongo_port: int
     db_name: str
     mongo_uri: str = None
+    mongo_max_pool_size: int = 50
+    mongo_min_pool_size: int = 0
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 30000
+    mongo_compressors: str = "zstd,zlib"  # se negocian con el servidor por orden
+    mongo_change_streams: bool = True  # invalidación de cachés entre workers (requiere replica set)
     
     POSTGRES_HOST: str
     POSTGRES_PORT: int
     POSTGRES_DATABASE: str  # ← Note: DATABASE not DB
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
+    POSTGRES_POOL_MIN_SIZE: int = 1
+    POSTGRES_POOL_MAX_SIZE: int = 10
+    POSTGRES_RETRY_INTERVAL: int = 5  # segundos entre intentos si Postgres no responde
+
+    # Caché del directorio de usuarios (id -> username)
+    USER_CACHE_TTL: int = 300
+    USER_CACHE_MAX_SIZE: int = 10000
+
+    # Caché de nombres de categoría (id -> nombre) de listados y exports
+    CATEGORY_CACHE_TTL: int = 300
+    CATEGORY_CACHE_MAX_SIZE: int = 10000
+
+    # Envío de emails (cola en segundo plano)
+    EMAIL_USER: str = ""
+    EMAIL_PASS: str = ""
+    EMAIL_HOST: str = "smtp.gmail.com"
+    EMAIL_PORT: int = 465
+    EMAIL_USE_SSL: bool = True
+    EMAIL_TIMEOUT: int = 30
+    EMAIL_QUEUE_SIZE: int = 100
+    EMAIL_WORKERS: int = 2
+    EMAIL_MAX_RETRIES: int = 3
+    EMAIL_JOB_TTL_DAYS: int = 7  # estado consultable en /finanzas/email/{job_id}
+
+    # Sincronización incremental (GET /transactions/changes)
+    # Margen para escrituras todavía en curso: debe cubrir lo que tarda una escritura
+    # en ser visible tras sellar updated_at más el desfase de reloj entre hosts de la API
+    CHANGES_SETTLE_SECONDS: int = 5
+    TRANSACTION_TOMBSTONE_TTL_DAYS: int = 30  # tokens más antiguos exigen resincronizar
+
+    # Token Bearer que debe enviar Prometheus a /metrics; vacío desactiva el endpoint
+    METRICS_TOKEN: str = ""
+
+    # Nivel de log de la aplicación (DEBUG activa los logs de diagnóstico)
+    LOG_LEVEL: str = "INFO"
 
     class Config:
         env_file = "../.env"
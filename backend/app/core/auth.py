@@ -1,22 +1,154 @@
+import hashlib
 import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 import jwt
 from fastapi import Request, HTTPException, Depends
+from app.core.invalidation import invalidation_bus
+from app.db import get_db
 
-JWT_SECRET = os.getenv("JWT_SECRET", "mi_secreto")
+DEFAULT_JWT_SECRET = "mi_secreto"
+JWT_SECRET = os.getenv("JWT_SECRET", DEFAULT_JWT_SECRET)
 ALGORITHM = "HS256"
 
-def verify_token(request: Request):
+
+class TokenCache:
+    """LRU de tokens ya verificados: sha256(token) -> claims hasta su exp.
+
+    Evita repetir la verificación HMAC y el parseo de claims en cada petición.
+    Las revocaciones se guardan en MongoDB (revoked_tokens); aquí solo se
+    recuerdan las conocidas por este worker. Una entrada dura como mucho
+    max_age: al caducar se vuelve a verificar y a consultar revoked_tokens,
+    así que sin change streams un token revocado en otro worker se sigue
+    aceptando aquí como mucho max_age segundos (con change streams, al momento).
+    """
+
+    def __init__(self, max_size: int = 1024, default_ttl: int = 300, max_age: int = 30):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.max_age = max_age
+        self._cache = OrderedDict()  # digest -> (claims, expira_en)
+        self._revoked = {}  # digest -> expira_en
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, digest: str):
+        entry = self._cache.get(digest)
+        if entry and entry[1] > time.time():
+            self._cache.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+        if entry:
+            del self._cache[digest]
+        self.misses += 1
+        return None
+
+    def put(self, digest: str, claims: dict):
+        expires_at = min(claims.get("exp") or time.time() + self.default_ttl, time.time() + self.max_age)
+        self._cache[digest] = (claims, expires_at)
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def revoke(self, digest: str, expires_at: float = None):
+        self._cache.pop(digest, None)
+        self._revoked[digest] = expires_at or time.time() + self.max_age
+        # Limpiar revocaciones cuyo token ya habría expirado
+        now = time.time()
+        for key in [k for k, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[key]
+
+    def is_revoked(self, digest: str) -> bool:
+        return digest in self._revoked
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "revoked": len(self._revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+token_cache = TokenCache(
+    max_size=int(os.getenv("JWT_CACHE_SIZE", "1024")),
+    max_age=int(os.getenv("JWT_CACHE_MAX_AGE", "30")),
+)
+
+
+def revoked_tokens_collection():
+    # _id = sha256 del token; el índice TTL de expires_at (su exp) las borra solas
+    return get_db()["revoked_tokens"]
+
+
+async def revoke_token(token: str, exp: float = None):
+    """Revoca el token en todos los workers (logout)."""
+    digest = token_cache.digest(token)
+    expires_at = exp or time.time() + token_cache.default_ttl
+    token_cache.revoke(digest, expires_at)
+    await revoked_tokens_collection().update_one(
+        {"_id": digest},
+        {"$set": {"expires_at": datetime.fromtimestamp(expires_at, timezone.utc)}},
+        upsert=True
+    )
+
+
+@invalidation_bus.subscribe
+def invalidate_revoked_tokens(event: dict):
+    # Revocaciones hechas en otros workers (change streams)
+    if event["collection"] == "revoked_tokens" and event["op"] in ("insert", "update", "replace"):
+        token_cache.revoke(event["document_id"])
+    elif event["collection"] == "*":
+        token_cache.clear()
+
+
+def check_jwt_secret():
+    """Se llama al arrancar: no se admite el secreto por defecto."""
+    if JWT_SECRET == DEFAULT_JWT_SECRET:
+        raise RuntimeError("JWT_SECRET no está configurado: se está usando el secreto por defecto")
+
+
+async def decode_token(token: str) -> dict:
+    digest = token_cache.digest(token)
+    if token_cache.is_revoked(digest):
+        raise HTTPException(status_code=403, detail="Token revocado")
+
+    decoded = token_cache.get(digest)
+    if decoded is None:
+        try:
+            decoded = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=403, detail="Token expirado")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=403, detail="Token inválido")
+        # Solo al (re)verificar: una lectura por _id cada max_age como mucho
+        if await revoked_tokens_collection().find_one({"_id": digest}, {"_id": 1}):
+            token_cache.revoke(digest, decoded.get("exp"))
+            raise HTTPException(status_code=403, detail="Token revocado")
+        token_cache.put(digest, decoded)
+
+    # Copia para que nadie modifique las claims cacheadas
+    return dict(decoded)
+
+
+def get_bearer_token(request: Request) -> str:
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token requerido")
+    return auth_header.split(" ")[1]
+
 
-    token = auth_header.split(" ")[1]
-    try:
-        decoded = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=403, detail="Token expirado")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=403, detail="Token inválido")
+async def verify_token(request: Request):
+    decoded = await decode_token(get_bearer_token(request))
 
     # Chequear aprobación
     if not decoded.get("isApproved"):
@@ -31,4 +163,3 @@ def admin_required(decoded: dict = Depends(verify_token)):
             detail="Se requieren privilegios de administrador"
         )
     return decoded
-
@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from bson import ObjectId
+from app.config import settings
+from app.core.invalidation import invalidation_bus
+from app.db import get_db
+
+
+class CategoryNames:
+    """Resolución category_id -> nombre para listados y exports.
+
+    Solo se consultan a MongoDB (con $in) los ids de la página o lote actual
+    que no están en caché. Cada entrada guarda el dueño de la categoría, así
+    que un usuario normal solo resuelve sus propias categorías y los admins
+    resuelven todas. Las escrituras
+    de categorías en crud.py invalidan la entrada; las de otros workers
+    llegan por invalidation_bus.
+    """
+
+    def __init__(self, ttl: int = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache = OrderedDict()  # str(id) -> (user_id | None, nombre | None, expira_en)
+        self.hits = 0
+        self.misses = 0
+
+    async def get_names(self, category_ids, user: dict) -> dict:
+        """Devuelve {str(id): nombre} de las categorías visibles para user."""
+        now = time.monotonic()
+        entries = {}
+        missing = set()
+
+        for category_id in category_ids:
+            key = str(category_id)
+            entry = self._cache.get(key)
+            if entry and entry[2] > now:
+                self._cache.move_to_end(key)
+                entries[key] = entry
+                self.hits += 1
+            elif key not in missing and ObjectId.is_valid(key):
+                missing.add(key)
+                self.misses += 1
+
+        if missing:
+            found = {}
+            cursor = get_db()["categories"].find(
+                {"_id": {"$in": [ObjectId(key) for key in missing]}}, {"name": 1, "user_id": 1}
+            )
+            async for cat in cursor:
+                found[str(cat["_id"])] = (cat.get("user_id"), cat.get("name"))
+
+            expires_at = now + self.ttl
+            for key in missing:
+                # Las que no existen también se cachean (como None) hasta que expiren
+                owner, name = found.get(key, (None, None))
+                entries[key] = self._store(key, owner, name, expires_at)
+
+        is_admin = user.get("role") == "admin"
+        return {
+            key: name
+            for key, (owner, name, _) in entries.items()
+            if name is not None and (is_admin or owner == user["userId"])
+        }
+
+    def invalidate(self, category_id=None):
+        if category_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(str(category_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _store(self, key: str, owner, name, expires_at: float):
+        entry = (owner, name, expires_at)
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return entry
+
+
+category_names = CategoryNames(
+    ttl=settings.CATEGORY_CACHE_TTL,
+    max_size=settings.CATEGORY_CACHE_MAX_SIZE,
+)
+
+
+@invalidation_bus.subscribe
+def invalidate_category_names(event: dict):
+    # Categorías renombradas o borradas desde cualquier worker (change streams)
+    if event["collection"] == "categories":
+        category_names.invalidate(event["document_id"])
+    elif event["collection"] == "*":
+        category_names.invalidate()
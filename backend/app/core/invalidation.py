@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """Bus en proceso: las cachés se suscriben y reciben los eventos de cambio.
+
+    Evento: {"collection": str, "op": str, "user_ids": set, "document_id": ObjectId | None}.
+    user_ids vacío significa "no se sabe a quién afecta": invalidar todo.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, event: dict):
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Error invalidando caché", extra={"subscriber": callback.__qualname__})
+
+
+invalidation_bus = InvalidationBus()
+
+
+class ChangeStreamWatcher:
+    """Tarea de fondo que sigue los change streams de MongoDB.
+
+    Publica en invalidation_bus cada cambio de las colecciones vigiladas, de modo
+    que todos los workers invalidan sus cachés aunque la escritura la hiciera otro.
+    El resume token se guarda en la colección change_stream_tokens para retomar
+    el stream tras un reinicio o una reconexión. Requiere replica set.
+    """
+
+    HISTORY_LOST = 286  # ChangeStreamHistoryLost: el token ya no está en el oplog
+    NOT_REPLICA_SET = 40573
+
+    # Solo colecciones con cachés suscritas: vigilar transactions haría que
+    # cada worker procesara (y guardara token de) toda escritura de movimientos
+    def __init__(self, collections=("categories", "revoked_tokens"),
+                 token_id: str = "cache_invalidation", persist_interval: float = 1.0):
+        self.collections = list(collections)
+        self.token_id = token_id
+        self.persist_interval = persist_interval
+        self._task = None
+
+    def start(self, db):
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _enable_pre_images(self, db):
+        # Sin pre-imagen, un delete no dice de qué usuario era y se invalida todo
+        for collection in self.collections:
+            try:
+                await db.command("collMod", collection, changeStreamPreAndPostImages={"enabled": True})
+            except PyMongoError:
+                pass
+
+    async def _run(self, db):
+        await self._enable_pre_images(db)
+        tokens = db["change_stream_tokens"]
+        saved = await tokens.find_one({"_id": self.token_id})
+        resume_token = saved["token"] if saved else None
+        backoff = 1
+
+        while True:
+            pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+            try:
+                async with db.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    start_after=resume_token,
+                ) as stream:
+                    backoff = 1
+                    last_persist = time.monotonic()
+                    async for change in stream:
+                        invalidation_bus.publish(self._to_event(change))
+                        resume_token = stream.resume_token
+                        if time.monotonic() - last_persist >= self.persist_interval:
+                            await tokens.update_one(
+                                {"_id": self.token_id}, {"$set": {"token": resume_token}}, upsert=True
+                            )
+                            last_persist = time.monotonic()
+            except asyncio.CancelledError:
+                if resume_token:
+                    await tokens.update_one(
+                        {"_id": self.token_id}, {"$set": {"token": resume_token}}, upsert=True
+                    )
+                raise
+            except OperationFailure as e:
+                if e.code == self.NOT_REPLICA_SET:
+                    logger.warning("Change streams no disponibles (MongoDB sin replica set): invalidación solo local")
+                    return
+                if e.code == self.HISTORY_LOST:
+                    # Se han perdido eventos: empezar de cero e invalidar todo
+                    logger.warning("Resume token caducado: se reinicia el change stream")
+                    resume_token = None
+                    await tokens.delete_one({"_id": self.token_id})
+                    invalidation_bus.publish({"collection": "*", "op": "reset", "user_ids": set(), "document_id": None})
+                    continue
+                logger.error("Error en change stream", extra={"error": str(e), "retry_in": backoff})
+            except PyMongoError as e:
+                logger.error("Error en change stream", extra={"error": str(e), "retry_in": backoff})
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    @staticmethod
+    def _to_event(change: dict) -> dict:
+        user_ids = set()
+        for key in ("fullDocument", "fullDocumentBeforeChange"):
+            doc = change.get(key)
+            if doc and doc.get("user_id") is not None:
+                user_ids.add(doc["user_id"])
+        return {
+            "collection": change["ns"]["coll"],
+            "op": change["operationType"],
+            "user_ids": user_ids,
+            "document_id": change.get("documentKey", {}).get("_id"),
+        }
+
+
+change_stream_watcher = ChangeStreamWatcher()
@@ -0,0 +1,26 @@
+import logging
+import sys
+
+# Logging estructurado: mensaje seguido de los campos de extra={...} como clave=valor.
+# El nivel se controla con LOG_LEVEL (DEBUG, INFO, WARNING...).
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RESERVED}
+        if fields:
+            line += " " + " ".join(f"{k}={v!r}" if isinstance(v, str) and " " in v else f"{k}={v}"
+                                   for k, v in fields.items())
+        return line
+
+
+def setup_logging(level: str = "INFO"):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root = logging.getLogger("app")
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    root.propagate = False
@@ -0,0 +1,146 @@
+import threading
+import time
+from pymongo import monitoring
+
+# Métricas de rendimiento por proceso en formato de exposición de Prometheus.
+# Cada worker de uvicorn tiene las suyas; Prometheus agrega al hacer scrape.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Histograma acumulativo por combinación de etiquetas.
+
+    observe() puede llamarse desde hilos (los listeners de pymongo se ejecutan
+    en los hilos de Motor), así que las series se actualizan bajo un lock.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # valores de etiquetas -> [cuentas por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = f"{labels}," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta",
+            ("method", "route", "status"), LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "http_response_size_bytes", "Tamaño del cuerpo de las respuestas HTTP por ruta",
+            ("method", "route"), SIZE_BUCKETS,
+        )
+        self.mongo_command_duration = Histogram(
+            "mongodb_command_duration_seconds", "Duración de los comandos de MongoDB",
+            ("command", "status"), LATENCY_BUCKETS,
+        )
+        self.postgres_query_duration = Histogram(
+            "postgres_query_duration_seconds", "Duración de las consultas a Postgres (asyncpg)",
+            ("query", "status"), LATENCY_BUCKETS,
+        )
+
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.request_duration, self.response_size,
+                          self.mongo_command_duration, self.postgres_query_duration):
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener de pymongo: se pasa al cliente en app.db (event_listeners)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        metrics.mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+def record_postgres_query(record):
+    """Query logger de asyncpg (Connection.add_query_logger)."""
+    # Las consultas son constantes parametrizadas: el SQL sirve de etiqueta
+    query = " ".join(record.query.split())[:120]
+    metrics.postgres_query_duration.observe(record.elapsed, query, "error" if record.exception else "ok")
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia y tamaño de respuesta por ruta.
+
+    Se mide hasta el último fragmento del cuerpo, así que las respuestas en
+    streaming (exports) cuentan su duración y tamaño reales. La ruta es la
+    plantilla (/transactions/{tx_id}), no la URL, para acotar las series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            metrics.request_duration.observe(time.perf_counter() - start, scope["method"], path, status)
+            metrics.response_size.observe(size, scope["method"], path)
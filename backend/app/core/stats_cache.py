@@ -0,0 +1,93 @@
+import hashlib
+from collections import OrderedDict
+from app.db import get_db
+
+
+class StatsCache:
+    """Caché de resultados de /stats por (ámbito, endpoint, parámetros).
+
+    Cada usuario tiene una versión de datos que suben las escrituras de
+    transacciones; los admins usan la versión global, derivada de las de
+    todos los usuarios, que sube con cualquier escritura. Las versiones viven en MongoDB (stats_versions), así que todos
+    los workers comparten versión, ETag y Last-Modified; cada worker guarda
+    en memoria los resultados, y una entrada solo es válida para la versión
+    con la que se calculó.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._cache = OrderedDict()  # clave -> (versión, payload)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(user: dict) -> str:
+        return "*" if user.get("role") == "admin" else str(user["userId"])
+
+    @staticmethod
+    def versions_collection():
+        return get_db()["stats_versions"]
+
+    async def version(self, scope: str):
+        """(versión, última modificación | None) del ámbito.
+
+        Un usuario lee su documento por _id. El ámbito global no tiene contador
+        propio (sería un documento caliente que toca cada escritura): se deriva
+        de todos los documentos, y como las versiones solo suben, su suma cambia
+        con cualquier escritura.
+        """
+        if scope != "*":
+            doc = await self.versions_collection().find_one({"_id": scope})
+            if doc is None:
+                return 0, None
+            return doc["version"], doc["modified_at"]
+        rows = await self.versions_collection().aggregate([
+            {"$group": {"_id": None, "version": {"$sum": "$version"}, "modified_at": {"$max": "$modified_at"}}}
+        ]).to_list(length=1)
+        if not rows:
+            return 0, None
+        return rows[0]["version"], rows[0]["modified_at"]
+
+    async def bump(self, user_id=None):
+        """Marca como modificados los datos de user_id (una sola escritura).
+
+        modified_at lo pone el reloj de MongoDB ($currentDate): uno solo para todos los workers.
+        """
+        update = {"$inc": {"version": 1}, "$currentDate": {"modified_at": True}}
+        if user_id is None:
+            # Cambio global (rebuild, migración...): invalidar todos los ámbitos;
+            # el documento "*" asegura que la suma global suba aunque no haya usuarios
+            await self.versions_collection().update_one({"_id": "*"}, update, upsert=True)
+            await self.versions_collection().update_many({"_id": {"$ne": "*"}}, update)
+            return
+        await self.versions_collection().update_one({"_id": str(user_id)}, update, upsert=True)
+
+    def etag(self, key: tuple, version: int) -> str:
+        key_hash = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        return f'"{version}-{key_hash}"'
+
+    def get(self, key: tuple, version: int):
+        entry = self._cache.get(key)
+        if entry and entry[0] == version:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, version: int, payload):
+        self._cache[key] = (version, payload)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+stats_cache = StatsCache()
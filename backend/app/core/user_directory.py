@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+import asyncpg
+from app.config import settings
+from app.core.metrics import record_postgres_query
+
+logger = logging.getLogger(__name__)
+
+
+class UserDirectory:
+    """Directorio de usuarios de Postgres (id -> username).
+
+    Mantiene un pool de asyncpg creado en el arranque de la app y una caché
+    en memoria con TTL y tamaño acotado. Solo se consultan a Postgres los ids
+    que no están en caché. Si Postgres no estaba disponible al arrancar, el
+    pool se vuelve a intentar crear al pedir usernames (como mucho uno cada
+    retry_interval segundos).
+    """
+
+    def __init__(self, ttl: int = 300, max_size: int = 10000, retry_interval: float = 5):
+        self.pool = None
+        self.ttl = ttl
+        self.max_size = max_size
+        self.retry_interval = retry_interval
+        self._retry_at = 0
+        self._connect_lock = asyncio.Lock()
+        self._cache = OrderedDict()  # id -> (username, expira_en)
+        self.hits = 0
+        self.misses = 0
+
+    async def connect(self):
+        try:
+            self.pool = await asyncpg.create_pool(
+                dsn=settings.POSTGRES_URI,
+                min_size=settings.POSTGRES_POOL_MIN_SIZE,
+                max_size=settings.POSTGRES_POOL_MAX_SIZE,
+                init=self._init_connection,
+            )
+        except Exception as e:
+            logger.error("Error conectando a Postgres", extra={"error": str(e)})
+            self.pool = None
+            self._retry_at = time.monotonic() + self.retry_interval
+
+    async def ensure_pool(self):
+        """Pool disponible o None; reintenta la conexión si toca."""
+        if self.pool is None and time.monotonic() >= self._retry_at:
+            async with self._connect_lock:
+                if self.pool is None and time.monotonic() >= self._retry_at:
+                    await self.connect()
+        return self.pool
+
+    @staticmethod
+    async def _init_connection(conn):
+        # Tiempos de cada consulta para /metrics
+        conn.add_query_logger(record_postgres_query)
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def get_usernames(self, user_ids) -> dict:
+        """Devuelve {str(id): username} para los ids indicados."""
+        now = time.monotonic()
+        result = {}
+        missing = set()
+
+        for user_id in user_ids:
+            try:
+                key = int(user_id)
+            except (TypeError, ValueError):
+                continue
+            entry = self._cache.get(key)
+            if entry and entry[1] > now:
+                self._cache.move_to_end(key)
+                result[str(key)] = entry[0]
+                self.hits += 1
+            elif key not in missing:
+                missing.add(key)
+                self.misses += 1
+
+        pool = await self.ensure_pool() if missing else None
+        if pool:
+            try:
+                rows = await pool.fetch(
+                    "SELECT id, username FROM users WHERE id = ANY($1::int[])",
+                    list(missing)
+                )
+            except Exception as e:
+                logger.error("Error consultando usuarios en Postgres", extra={"error": str(e)})
+                rows = []
+
+            expires_at = now + self.ttl
+            for row in rows:
+                self._store(row["id"], row["username"], expires_at)
+                result[str(row["id"])] = row["username"]
+
+        return result
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(int(user_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _store(self, user_id: int, username: str, expires_at: float):
+        self._cache[user_id] = (username, expires_at)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+
+user_directory = UserDirectory(
+    ttl=settings.USER_CACHE_TTL,
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    retry_interval=settings.POSTGRES_RETRY_INTERVAL,
+)
@@ -1,79 +1,87 @@
 from app.config import settings
-from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
+from app.db import get_db
+from app.core.stats_cache import stats_cache
+from app.core.category_names import category_names
+from app.core.user_directory import user_directory
+from app.utils.budget_alerts import notify_budget_alert
+import asyncio
+import base64
+import logging
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 from fastapi import HTTPException
-import asyncpg 
-import os
 from dotenv import load_dotenv
 load_dotenv()
 
-client = AsyncIOMotorClient(settings.mongo_uri)
-db = client[settings.db_name]
-
-# Comun. Conexion con Postgres.
-async def get_users_from_postgres():
-    conn = None
-    try:
-        conn = await asyncpg.connect(
-            host=os.getenv('POSTGRES_HOST'),
-            port=int(os.getenv('POSTGRES_PORT')),
-            user=os.getenv('POSTGRES_USER'),
-            password=os.getenv('POSTGRES_PASSWORD'),
-            database=os.getenv('POSTGRES_DATABASE')
-        )
-        users = await conn.fetch("SELECT id, username FROM users")
-        return users
-    except Exception as e:
-        print(f"Error conectando a Postgres: {e}")
-        return []
-    finally:
-        if conn:
-            await conn.close()
+logger = logging.getLogger(__name__)
 
 
 # Usuarios
-users_collection = db["users"]
+def users_collection():
+    return get_db()["users"]
 
 async def create_user(user_data: dict):
-    result = await users_collection.insert_one(user_data)
-    return await users_collection.find_one({"_id": result.inserted_id})
+    # insert_one añade el _id generado al propio dict
+    await users_collection().insert_one(user_data)
+    return user_data
 
 async def get_users():
-    return await users_collection.find().to_list(length=100)
+    return await users_collection().find().to_list(length=100)
 
 async def get_user(user_id: str):
-    return await users_collection.find_one({"_id": ObjectId(user_id)})
+    return await users_collection().find_one({"_id": ObjectId(user_id)})
 
 async def update_user(user_id: str, user_data: dict):
-    await users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": user_data})
-    return await get_user(user_id)
+    return await users_collection().find_one_and_update(
+        {"_id": ObjectId(user_id)}, {"$set": user_data}, return_document=ReturnDocument.AFTER
+    )
 
 async def delete_user(user_id: str):
-    result = await users_collection.delete_one({"_id": ObjectId(user_id)})
+    result = await users_collection().delete_one({"_id": ObjectId(user_id)})
     return result.deleted_count
 
 
 # Categorías
-categories_collection = db["categories"]
+def categories_collection():
+    return get_db()["categories"]
+
+def normalize_search(value: str) -> str:
+    """Minúsculas y sin acentos: 'Alimentación' -> 'alimentacion'."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+async def backfill_name_lower(batch_size: int = 1000) -> int:
+    """Rellena name_lower en categorías antiguas; sin él no salen al buscar por nombre."""
+    updated = 0
+    while True:
+        batch = await categories_collection().find(
+            {"name_lower": {"$exists": False}}, {"name": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return updated
+        result = await categories_collection().bulk_write([
+            UpdateOne({"_id": cat["_id"]}, {"$set": {"name_lower": normalize_search(cat.get("name"))}})
+            for cat in batch
+        ], ordered=False)
+        updated += result.modified_count
 
 async def create_category(cat_data: dict, user: dict):
     cat_data["user_id"] = user["userId"]
-    result = await categories_collection.insert_one(cat_data)
-    return await categories_collection.find_one({"_id": result.inserted_id})
-
-async def get_categories(user: dict):
-    query = {}
-    if user["role"] != "admin":
-        query["user_id"] = user["userId"]
-    return await categories_collection.find(query).to_list(length=100)
+    cat_data["name_lower"] = normalize_search(cat_data.get("name"))
+    await categories_collection().insert_one(cat_data)
+    category_names.invalidate(cat_data["_id"])
+    return cat_data
 
 async def get_category(cat_id: str, user: dict):
     query = {"_id": ObjectId(cat_id)}
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
 
-    category = await categories_collection.find_one(query)
+    category = await categories_collection().find_one(query)
     if not category:
         raise HTTPException(status_code=404, detail="Categoría no encontrada o sin permisos")
     return category
@@ -83,26 +91,76 @@ async def update_category(cat_id: str, cat_data: dict, user: dict):
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
 
-    result = await categories_collection.update_one(query, {"$set": cat_data})
-    if result.matched_count == 0:
+    if "name" in cat_data:
+        cat_data["name_lower"] = normalize_search(cat_data["name"])
+    previous = await categories_collection().find_one_and_update(
+        query, {"$set": cat_data}, return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="No tienes permisos para actualizar esta categoría")
+    updated = {**previous, **cat_data}
 
-    return await categories_collection.find_one({"_id": ObjectId(cat_id)})
+    # El nombre aparece en los listados de transacciones y en /stats/by-category.
+    # El frontend siempre envía name: solo se propaga si ha cambiado de verdad
+    if updated.get("name") != previous.get("name"):
+        category_names.invalidate(cat_id)
+        await stats_cache.bump(updated.get("user_id"))
+        run_in_background(fan_out_category_name(updated["_id"], updated["name"], updated.get("user_id")))
+    return updated
 
 async def delete_category(cat_id: str, user: dict):
     query = {"_id": ObjectId(cat_id)}
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
 
-    result = await categories_collection.delete_one(query)
-    if result.deleted_count == 0:
+    deleted = await categories_collection().find_one_and_delete(query)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="No tienes permisos para eliminar esta categoría")
+    category_names.invalidate(cat_id)
+    await stats_cache.bump(deleted.get("user_id"))
+    # Sin nombre, las lecturas la tratan como desconocida (igual que antes del borrado)
+    run_in_background(fan_out_category_name(deleted["_id"], None, deleted.get("user_id")))
 
     return {"deleted": True}
 
 
 # Transacciones
-transactions_collection = db["transactions"]
+def transactions_collection():
+    return get_db()["transactions"]
+
+def normalize_date(value) -> datetime:
+    """Fecha tal y como la devuelve MongoDB: UTC sin tzinfo y con precisión de milisegundos."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+def change_time() -> datetime:
+    """updated_at de las escrituras (y de las marcas de borrado).
+
+    Es el reloj de este proceso: se sella justo antes de cada escritura y
+    /transactions/changes solo entrega hasta ahora - CHANGES_SETTLE_SECONDS, así
+    que ese margen tiene que cubrir lo que tarda una escritura en ser visible
+    más el desfase de reloj entre los hosts de la API (NTP).
+    """
+    return normalize_date(datetime.now(timezone.utc))
+
+def check_change_delay(updated_at: datetime, operation: str):
+    # Una escritura visible después del margen puede no llegar a los clientes que sincronizan
+    elapsed = (change_time() - updated_at).total_seconds()
+    if elapsed > settings.CHANGES_SETTLE_SECONDS:
+        logger.warning("Escritura más lenta que CHANGES_SETTLE_SECONDS", extra={
+            "operation": operation, "seconds": round(elapsed, 3)
+        })
+
+def to_object_id(value, field: str = "id") -> ObjectId:
+    """category_id se guarda como ObjectId; en la API viaja como string."""
+    if isinstance(value, ObjectId):
+        return value
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail=f"{field} inválido")
+    return ObjectId(value)
 
 async def create_transaction(tx_data: dict, user: dict):
     # Si viene user_id en los datos y es diferente al usuario logueado
@@ -118,24 +176,264 @@ async def create_transaction(tx_data: dict, user: dict):
         tx_data["user_id"] = user["userId"]
     
     # Mover la conversión de fecha FUERA del else
-    if "date" in tx_data and isinstance(tx_data["date"], str):
-        tx_data["date"] = datetime.fromisoformat(tx_data["date"].replace('Z', ''))
+    if "date" in tx_data:
+        tx_data["date"] = normalize_date(tx_data["date"])
+    if "category_id" in tx_data:
+        tx_data["category_id"] = to_object_id(tx_data["category_id"], "category_id")
+    await denormalize_names([tx_data], user)
+    tx_data["updated_at"] = change_time()
     
-    result = await transactions_collection.insert_one(tx_data)
-    return await transactions_collection.find_one({"_id": result.inserted_id})
+    # insert_one añade el _id generado a tx_data: no hace falta releer el documento
+    await transactions_collection().insert_one(tx_data)
+    check_change_delay(tx_data["updated_at"], "create_transaction")
+    await add_to_rollup(tx_data)
+    await apply_to_budgets([tx_data])
+    await stats_cache.bump(tx_data["user_id"])
+    return tx_data
 
-async def get_transactions(user: dict):
+async def denormalize_names(docs: list, user: dict):
+    """Copia en cada documento username y category_name (instantáneas).
+
+    Solo para los campos presentes (user_id / category_id). Si un nombre no se
+    puede resolver se guarda None y las lecturas lo resuelven como antes.
+    """
+    user_ids = {doc["user_id"] for doc in docs if "user_id" in doc}
+    category_ids = {doc["category_id"] for doc in docs if "category_id" in doc}
+    user_map = await user_directory.get_usernames(user_ids) if user_ids else {}
+    category_map = await category_names.get_names(category_ids, user) if category_ids else {}
+    for doc in docs:
+        if "user_id" in doc:
+            doc["username"] = user_map.get(str(doc["user_id"]))
+        if "category_id" in doc:
+            doc["category_name"] = category_map.get(str(doc["category_id"]))
+
+# Tareas en segundo plano (propagación de renombrados): se guarda una
+# referencia para que el recolector no las cancele antes de terminar.
+_background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+FAN_OUT_BATCH_SIZE = 1000
+
+async def fan_out_category_name(category_id: ObjectId, name, owner_id=None):
+    """Actualiza category_name en las transacciones y rollups de la categoría, por lotes.
+
+    Recorre las transacciones por _id (índice category_id + _id), así que cada
+    lote continúa donde acabó el anterior. Si la categoría vuelve a cambiar
+    mientras tanto se abandona: la propagación del cambio más reciente se
+    encarga del resto.
+    """
+    query = {"category_id": category_id, "category_name": {"$ne": name}}
+    updated = 0
+    last_id = None
+    try:
+        while True:
+            current = await categories_collection().find_one({"_id": category_id}, {"name": 1})
+            if (current["name"] if current else None) != name:
+                return
+            page = dict(query)
+            if last_id is not None:
+                page["_id"] = {"$gt": last_id}
+            batch = await transactions_collection().find(page, {"_id": 1}).sort("_id", 1).limit(
+                FAN_OUT_BATCH_SIZE
+            ).to_list(length=FAN_OUT_BATCH_SIZE)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            result = await transactions_collection().update_many(
+                {"_id": {"$in": [tx["_id"] for tx in batch]}, **query},
+                {"$set": {"category_name": name, "updated_at": change_time()}}
+            )
+            updated += result.modified_count
+        await rollups_collection().update_many(
+            {"category_id": category_id}, {"$set": {"category_name": name}}
+        )
+        await budgets_collection().update_many(
+            {"category_id": category_id}, {"$set": {"category_name": name}}
+        )
+        # Solo cambian las stats del dueño (las de admin se invalidan con cualquier bump)
+        await stats_cache.bump(owner_id)
+        logger.info("Nombre de categoría propagado", extra={
+            "category_id": str(category_id), "transactions": updated
+        })
+    except Exception:
+        logger.exception("Error propagando el nombre de la categoría", extra={"category_id": str(category_id)})
+
+async def get_category_ids(user: dict) -> set:
+    """Ids de las categorías que el usuario puede usar (todas si es admin)."""
     query = {}
+    if user["role"] != "admin":
+        query["user_id"] = user["userId"]
+    cursor = categories_collection().find(query, {"_id": 1})
+    return {cat["_id"] async for cat in cursor}
+
+# Documentos por insert_many: cada tramo se sella justo antes de escribirlo
+INSERT_CHUNK_SIZE = 500
+
+async def insert_transactions_bulk(docs: list, user: dict):
+    """insert_many sin orden; devuelve (documentos insertados, {índice: error}).
+
+    Rollups, presupuestos y caché de /stats se actualizan tramo a tramo justo
+    después de cada insert_many: si un tramo posterior falla (red, timeout,
+    cambio de primario...) lo ya escrito queda contabilizado.
+    """
+    await denormalize_names(docs, user)
+    errors = {}
+    inserted = []
+    for offset in range(0, len(docs), INSERT_CHUNK_SIZE):
+        chunk = docs[offset:offset + INSERT_CHUNK_SIZE]
+        updated_at = change_time()
+        for doc in chunk:
+            doc["updated_at"] = updated_at
+        chunk_errors = {}
+        try:
+            await transactions_collection().insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                chunk_errors[err["index"]] = err.get("errmsg", "Error de escritura")
+        check_change_delay(updated_at, "insert_transactions_bulk")
+        errors.update({offset + i: error for i, error in chunk_errors.items()})
+
+        written = [doc for i, doc in enumerate(chunk) if i not in chunk_errors]
+        await add_many_to_rollups(written)
+        await apply_to_budgets(written)
+        for user_id in {doc["user_id"] for doc in written}:
+            await stats_cache.bump(user_id)
+        inserted += written
+    return inserted, errors
+
+def encode_cursor(tx: dict) -> str:
+    raw = f"{tx['date'].isoformat()}|{tx['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_str, tx_id = raw.split("|")
+        return datetime.fromisoformat(date_str), ObjectId(tx_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+async def get_transactions(user: dict, filters: dict = None, limit: int = 1000, after: str = None):
+    """Página de transacciones ordenada por (date, _id) descendente.
+
+    Devuelve (transacciones, next_cursor); next_cursor es None en la última página.
+    """
+    query = dict(filters or {})
     if user["role"] != "admin":
         query["user_id"] = user["userId"]  # ← Filtrar por usuario
-    return await transactions_collection.find(query).to_list(length=1000)
+
+    if after:
+        last_date, last_id = decode_cursor(after)
+        query = {"$and": [query, {"$or": [
+            {"date": {"$lt": last_date}},
+            {"date": last_date, "_id": {"$lt": last_id}},
+        ]}]}
+
+    cursor = transactions_collection().find(query).sort([("date", -1), ("_id", -1)]).limit(limit + 1)
+    transactions = await cursor.to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1])
+    return transactions, next_cursor
+
+# Sincronización incremental: altas/cambios (updated_at) y borrados (tombstones)
+def tombstones_collection():
+    return get_db()["transaction_tombstones"]
+
+async def add_tombstone(tx: dict, moved: bool = False):
+    """Marca de borrado de tx para su dueño (user_id).
+
+    Cada marca tiene su propio _id (tx_id apunta a la transacción) para que una
+    transacción que cambia de dueño varias veces deje una marca a cada uno.
+    moved=True: sigue existiendo con otro dueño, no es un borrado para el admin.
+    """
+    tombstone = {"tx_id": tx["_id"], "user_id": tx["user_id"], "updated_at": change_time()}
+    if moved:
+        tombstone["moved"] = True
+    await tombstones_collection().insert_one(tombstone)
+    check_change_delay(tombstone["updated_at"], "tombstone")
+
+NO_ID = ObjectId("0" * 24)
+
+def encode_change_token(updated_at: datetime, doc_id: ObjectId) -> str:
+    raw = f"{updated_at.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def change_watermark() -> datetime:
+    """Límite superior de lo que se entrega: las escrituras más recientes aún
+    pueden estar en curso con un updated_at anterior al de otras ya visibles."""
+    return change_time() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+
+def initial_change_token() -> str:
+    # Token para empezar a sincronizar justo después de descargar el listado completo
+    return encode_change_token(change_watermark(), NO_ID)
+
+async def get_transaction_changes(user: dict, since: str, limit: int = 1000, user_id: int = None):
+    """Cambios posteriores al token, ordenados por (updated_at, _id).
+
+    Devuelve (transacciones cambiadas, ids borrados, siguiente token, hay_más).
+    """
+    since_at, since_id = decode_cursor(since)
+    if since_at < change_time() - timedelta(days=settings.TRANSACTION_TOMBSTONE_TTL_DAYS):
+        # Las marcas de borrado de entonces ya han caducado
+        raise HTTPException(status_code=410, detail="Token de cambios caducado: descarga de nuevo el listado")
+
+    scope = {}
+    if user["role"] != "admin":
+        scope["user_id"] = user["userId"]
+    elif user_id is not None:
+        scope["user_id"] = user_id
+
+    watermark = change_watermark()
+    tombstone_scope = scope if scope else {"moved": {"$ne": True}}
+    query = {"$and": [
+        {"updated_at": {"$lte": watermark}},
+        {"$or": [
+            {"updated_at": {"$gt": since_at}},
+            {"updated_at": since_at, "_id": {"$gt": since_id}},
+        ]},
+    ]}
+    order = [("updated_at", 1), ("_id", 1)]
+    changed = await transactions_collection().find({**scope, **query}).sort(order).limit(
+        limit + 1
+    ).to_list(length=limit + 1)
+    deleted = await tombstones_collection().find({**tombstone_scope, **query}).sort(order).limit(
+        limit + 1
+    ).to_list(length=limit + 1)
+    for tombstone in deleted:
+        tombstone["deleted"] = True
+
+    merged = sorted(changed + deleted, key=lambda doc: (doc["updated_at"], doc["_id"]))
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+
+    last = (since_at, since_id)
+    if merged:
+        last = (merged[-1]["updated_at"], merged[-1]["_id"])
+    if not has_more:
+        # Todo lo anterior al watermark está entregado: avanzar hasta él
+        last = max(last, (watermark, NO_ID))
+    return (
+        [doc for doc in merged if not doc.get("deleted")],
+        # Marcas antiguas: el _id era el de la transacción
+        [str(doc.get("tx_id", doc["_id"])) for doc in merged if doc.get("deleted")],
+        encode_change_token(*last),
+        has_more,
+    )
 
 async def get_transaction(tx_id: str, user: dict):
     query = {"_id": ObjectId(tx_id)}
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
     
-    transaction = await transactions_collection.find_one(query)
+    transaction = await transactions_collection().find_one(query)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transacción no encontrada")
     return transaction
@@ -144,15 +442,38 @@ async def update_transaction(tx_id: str, tx_data: dict, user: dict):
     query = {"_id": ObjectId(tx_id)}
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
+        if tx_data.get("user_id", user["userId"]) != user["userId"]:
+            raise HTTPException(
+                status_code=403,
+                detail="Solo administradores pueden asignar transacciones a otros usuarios"
+            )
     
     # Corregir indentación
-    if "date" in tx_data and isinstance(tx_data["date"], str):
-        tx_data["date"] = datetime.fromisoformat(tx_data["date"].replace('Z', ''))
+    if "date" in tx_data:
+        tx_data["date"] = normalize_date(tx_data["date"])
+    if "category_id" in tx_data:
+        tx_data["category_id"] = to_object_id(tx_data["category_id"], "category_id")
+    await denormalize_names([tx_data], user)
+    tx_data["updated_at"] = change_time()
     
-    result = await transactions_collection.update_one(query, {"$set": tx_data})
-    if result.matched_count == 0:
+    previous = await transactions_collection().find_one_and_update(
+        query, {"$set": tx_data}, return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Transacción no encontrada")
-    return await get_transaction(tx_id, user)
+    check_change_delay(tx_data["updated_at"], "update_transaction")
+    updated = {**previous, **tx_data}
+    if updated["user_id"] != previous["user_id"]:
+        # Cambio de dueño: para la sincronización del anterior es un borrado, y
+        # las marcas del nuevo (si la tuvo antes) ya no aplican
+        await add_tombstone(previous, moved=True)
+        await tombstones_collection().delete_many({"tx_id": previous["_id"], "user_id": updated["user_id"]})
+    await remove_from_rollup(previous)
+    await add_to_rollup(updated)
+    await apply_to_budgets([updated], [previous])
+    await stats_cache.bump(previous["user_id"])
+    await stats_cache.bump(updated["user_id"])
+    return updated
 
 
 async def delete_transaction(tx_id: str, user: dict):
@@ -160,33 +481,412 @@ async def delete_transaction(tx_id: str, user: dict):
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
     
-    result = await transactions_collection.delete_one(query)
-    if result.deleted_count == 0:
+    deleted = await transactions_collection().find_one_and_delete(query)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Transacción no encontrada")
-    return result.deleted_count
+    # Marca de borrado para los clientes que sincronizan con /transactions/changes
+    await add_tombstone(deleted)
+    await remove_from_rollup(deleted)
+    await apply_to_budgets([], [deleted])
+    await stats_cache.bump(deleted["user_id"])
+    return 1
 
-async def get_transactions_filtered(user: dict, filters: dict = None):
-    query = {}
+def find_transactions_filtered(user: dict, filters: dict = None, batch_size: int = 500):
+    """Cursor sin límite de filas sobre las transacciones filtradas (para exports)."""
+    query = dict(filters or {})
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
-    
-    # Aplicar filtros adicionales si existen
-    if filters:
-        query.update(filters)
-    
-    return await transactions_collection.find(query).to_list(length=1000)
+    return transactions_collection().find(query).sort([("date", -1), ("_id", -1)]).batch_size(batch_size)
 
-async def get_categories_filtered(user: dict, filters: dict = None):
+async def get_transactions_summary(user: dict, filters: dict = None, top: int = 20):
+    """Primeras `top` transacciones y totales del filtro en una sola agregación."""
+    query = dict(filters or {})
+    if user["role"] != "admin":
+        query["user_id"] = user["userId"]
+    pipeline = [
+        {"$match": query},
+        {"$facet": {
+            "top": [
+                {"$sort": {"date": -1, "_id": -1}},
+                {"$limit": top},
+            ],
+            "totals": [
+                {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}},
+            ],
+        }},
+    ]
+    result = await transactions_collection().aggregate(pipeline).to_list(length=1)
+    facets = result[0] if result else {"top": [], "totals": []}
+    totals = facets["totals"][0] if facets["totals"] else {"count": 0, "amount": 0}
+    return facets["top"], totals["count"], totals["amount"]
+
+def build_categories_query(user: dict, filters: dict = None) -> dict:
+    """Filtros de búsqueda de categorías, compartidos por el listado y el export.
+
+    - name y description: contienen el texto, sin distinguir mayúsculas (lo que
+      espera el filtro del frontend). name va sobre name_lower, así que tampoco
+      distingue acentos; ambos se evalúan sobre las categorías del usuario.
+    - q: búsqueda de texto ($text, palabras y raíces) sobre nombre y descripción.
+    La entrada del usuario siempre se escapa: nunca se interpreta como regex.
+    """
     query = {}
     if user["role"] != "admin":
         query["user_id"] = user["userId"]
     
     if filters:
-        # Transformar filtros para MongoDB con búsqueda case-insensitive
-        if 'name' in filters and filters['name']:
-            query['name'] = {'$regex': f".*{filters['name']}.*", '$options': 'i'}
-        
-        if 'description' in filters and filters['description']:
-            query['description'] = {'$regex': f".*{filters['description']}.*", '$options': 'i'}
-    
-    return await categories_collection.find(query).to_list(length=1000)
+        if filters.get('name'):
+            query['name_lower'] = {'$regex': re.escape(normalize_search(filters['name']))}
+        if filters.get('description'):
+            query['description'] = {'$regex': re.escape(filters['description']), '$options': 'i'}
+        if filters.get('q'):
+            query['$text'] = {'$search': filters['q']}
+    return query
+
+def sort_categories(cursor, query: dict):
+    # Con búsqueda de texto, ordenar por relevancia; si no, por nombre
+    if '$text' in query:
+        return cursor.sort([("score", {"$meta": "textScore"}), ("_id", 1)])
+    return cursor.sort([("name_lower", 1), ("_id", 1)])
+
+def categories_projection(query: dict):
+    return {"score": {"$meta": "textScore"}} if '$text' in query else None
+
+async def get_categories_filtered(user: dict, filters: dict = None, limit: int = 1000, offset: int = 0):
+    query = build_categories_query(user, filters)
+    cursor = categories_collection().find(query, categories_projection(query))
+    cursor = sort_categories(cursor, query).skip(offset).limit(limit)
+    return await cursor.to_list(length=limit)
+
+def find_categories_filtered(user: dict, filters: dict = None, batch_size: int = 500):
+    """Cursor sin límite de filas sobre las categorías filtradas (para exports)."""
+    query = build_categories_query(user, filters)
+    cursor = categories_collection().find(query, categories_projection(query))
+    return sort_categories(cursor, query).batch_size(batch_size)
+
+
+# Rollups mensuales por (usuario, categoría, año, mes)
+# Los mantienen create/update/delete_transaction y los leen los endpoints de /stats.
+def rollups_collection():
+    return get_db()["transaction_rollups"]
+
+def rollup_key(tx: dict) -> dict:
+    date = tx["date"]
+    if date.tzinfo:
+        date = date.astimezone(timezone.utc)
+    return {
+        "user_id": tx["user_id"],
+        "category_id": tx["category_id"],
+        "year": date.year,
+        "month": date.month,
+    }
+
+def split_amount(amount: float):
+    """(ingreso, gasto) de un importe, ambos en positivo."""
+    return (amount, 0) if amount > 0 else (0, -amount)
+
+def rollup_names(tx: dict) -> dict:
+    # Nombres desnormalizados del cubo (los lee /stats sin ir a Postgres ni $lookup)
+    return {field: tx[field] for field in ("username", "category_name") if tx.get(field) is not None}
+
+async def add_to_rollup(tx: dict):
+    key = rollup_key(tx)
+    income, expense = split_amount(tx["amount"])
+    update = {
+        "$inc": {"sum": tx["amount"], "count": 1, "income": income, "expense": expense},
+        "$min": {"min": tx["amount"]},
+        "$max": {"max": tx["amount"]},
+        "$setOnInsert": {"ym": key["year"] * 100 + key["month"]},
+    }
+    names = rollup_names(tx)
+    if names:
+        update["$set"] = names
+    await rollups_collection().update_one(key, update, upsert=True)
+
+async def add_many_to_rollups(txs: list):
+    """Acumula el lote por cubo en memoria y aplica un único bulk_write."""
+    buckets = {}
+    for tx in txs:
+        key = rollup_key(tx)
+        bucket_id = tuple(key.values())
+        amount = tx["amount"]
+        if bucket_id not in buckets:
+            buckets[bucket_id] = {"key": key, "sum": 0, "count": 0, "income": 0, "expense": 0,
+                                  "min": amount, "max": amount, "names": {}}
+        bucket = buckets[bucket_id]
+        bucket["names"].update(rollup_names(tx))
+        income, expense = split_amount(amount)
+        bucket["sum"] += amount
+        bucket["count"] += 1
+        bucket["income"] += income
+        bucket["expense"] += expense
+        bucket["min"] = min(bucket["min"], amount)
+        bucket["max"] = max(bucket["max"], amount)
+
+    if not buckets:
+        return
+    operations = []
+    for b in buckets.values():
+        update = {
+            "$inc": {"sum": b["sum"], "count": b["count"], "income": b["income"], "expense": b["expense"]},
+            "$min": {"min": b["min"]},
+            "$max": {"max": b["max"]},
+            "$setOnInsert": {"ym": b["key"]["year"] * 100 + b["key"]["month"]},
+        }
+        if b["names"]:
+            update["$set"] = b["names"]
+        operations.append(UpdateOne(b["key"], update, upsert=True))
+    await rollups_collection().bulk_write(operations, ordered=False)
+
+async def remove_from_rollup(tx: dict):
+    key = rollup_key(tx)
+    income, expense = split_amount(tx["amount"])
+    bucket = await rollups_collection().find_one_and_update(
+        key,
+        {"$inc": {"sum": -tx["amount"], "count": -1, "income": -income, "expense": -expense}},
+        return_document=ReturnDocument.AFTER
+    )
+    if bucket is None:
+        return
+    if bucket["count"] <= 0:
+        # Condicional: si otra escritura ha sumado al cubo entre medias, se conserva
+        await rollups_collection().delete_one({**key, "count": {"$lte": 0}})
+    elif tx["amount"] in (bucket.get("min"), bucket.get("max")):
+        # El importe eliminado era un extremo: recalcular min/max solo de este cubo
+        await refresh_rollup_bounds(key)
+
+def month_range(year: int, month: int):
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+async def refresh_rollup_bounds(key: dict):
+    start, end = month_range(key["year"], key["month"])
+    pipeline = [
+        {"$match": {
+            "user_id": key["user_id"],
+            "category_id": key["category_id"],
+            "date": {"$gte": start, "$lt": end},
+        }},
+        {"$group": {"_id": None, "min": {"$min": "$amount"}, "max": {"$max": "$amount"}}},
+    ]
+    result = await transactions_collection().aggregate(pipeline).to_list(length=1)
+    if result:
+        await rollups_collection().update_one(
+            key, {"$set": {"min": result[0]["min"], "max": result[0]["max"]}}
+        )
+
+async def rebuild_rollups():
+    """Recalcula transaction_rollups desde cero (backfill / reparar desviaciones).
+
+    $out sustituye la colección de forma atómica al terminar la agregación, así
+    que los $inc de las escrituras que lleguen mientras se calcula se pierden:
+    lanzarlo sin escrituras de transacciones en curso (mantenimiento).
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "category_id": "$category_id",
+                "year": {"$year": "$date"},
+                "month": {"$month": "$date"},
+            },
+            "sum": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "income": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]}},
+            "expense": {"$sum": {"$cond": [{"$lt": ["$amount", 0]}, {"$multiply": ["$amount", -1]}, 0]}},
+            "min": {"$min": "$amount"},
+            "max": {"$max": "$amount"},
+            # $max ignora los null: cualquier nombre conocido del cubo
+            "username": {"$max": "$username"},
+            "category_name": {"$max": "$category_name"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "category_id": "$_id.category_id",
+            "year": "$_id.year",
+            "month": "$_id.month",
+            "ym": {"$add": [{"$multiply": ["$_id.year", 100]}, "$_id.month"]},
+            "sum": 1,
+            "count": 1,
+            "income": 1,
+            "expense": 1,
+            "min": 1,
+            "max": 1,
+            "username": 1,
+            "category_name": 1,
+        }},
+        {"$out": "transaction_rollups"},
+    ]
+    await transactions_collection().aggregate(pipeline).to_list(length=None)
+    await stats_cache.bump()
+    return await rollups_collection().count_documents({})
+
+
+# Presupuestos por (usuario, categoría, periodo) con contadores de gasto por periodo.
+# Las escrituras de transacciones aplican $inc al contador del periodo, así que
+# "gastado vs presupuesto" es una lectura de un documento y los avisos se
+# evalúan en el momento de la escritura, sin recorrer transactions.
+BUDGET_PERIODS = ("week", "month", "year")
+DEFAULT_BUDGET_THRESHOLDS = [0.8, 1.0]
+
+def budgets_collection():
+    return get_db()["budgets"]
+
+def budget_spending_collection():
+    return get_db()["budget_spending"]
+
+def period_start(date: datetime, period: str) -> datetime:
+    """Inicio (UTC sin tzinfo) del periodo que contiene date; semanas desde el lunes."""
+    date = normalize_date(date)
+    day = date.date()
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+    elif period == "month":
+        day = day.replace(day=1)
+    else:
+        day = day.replace(month=1, day=1)
+    return datetime(day.year, day.month, day.day)
+
+async def seed_budget_spending(budget: dict):
+    """Calcula de una vez los contadores de todos los periodos del presupuesto.
+
+    Solo se ejecuta al crear o cambiar el presupuesto (consulta por el índice
+    user_category_date). Los umbrales ya superados se marcan como avisados
+    para no notificar gasto antiguo.
+    """
+    await budget_spending_collection().delete_many({"budget_id": budget["_id"]})
+    date_trunc = {"date": "$date", "unit": budget["period"]}
+    if budget["period"] == "week":
+        date_trunc["startOfWeek"] = "monday"
+    pipeline = [
+        {"$match": {"user_id": budget["user_id"], "category_id": budget["category_id"], "amount": {"$lt": 0}}},
+        {"$group": {
+            "_id": {"$dateTrunc": date_trunc},
+            "spent": {"$sum": {"$multiply": ["$amount", -1]}},
+        }},
+    ]
+    operations = []
+    async for r in transactions_collection().aggregate(pipeline):
+        alerted = [t for t in budget["thresholds"] if r["spent"] >= t * budget["limit"]]
+        operations.append(UpdateOne(
+            {"budget_id": budget["_id"], "period_start": r["_id"]},
+            {"$set": {"user_id": budget["user_id"], "spent": r["spent"], "alerted": alerted}},
+            upsert=True
+        ))
+    if operations:
+        await budget_spending_collection().bulk_write(operations, ordered=False)
+
+async def budget_category(category_id, user: dict):
+    """(ObjectId, nombre) de una categoría propia del usuario."""
+    category_id = to_object_id(category_id, "category_id")
+    category = await categories_collection().find_one(
+        {"_id": category_id, "user_id": user["userId"]}, {"name": 1}
+    )
+    if category is None:
+        raise HTTPException(status_code=404, detail="Categoría no encontrada o sin permisos")
+    return category_id, category["name"]
+
+async def create_budget(budget_data: dict, user: dict):
+    budget_data["user_id"] = user["userId"]
+    budget_data["email"] = user.get("email")
+    budget_data["category_id"], budget_data["category_name"] = await budget_category(
+        budget_data["category_id"], user
+    )
+    budget_data["thresholds"] = sorted(set(budget_data.get("thresholds") or DEFAULT_BUDGET_THRESHOLDS))
+    await budgets_collection().insert_one(budget_data)
+    await seed_budget_spending(budget_data)
+    return budget_data
+
+async def get_budgets(user: dict):
+    return await budgets_collection().find({"user_id": user["userId"]}).to_list(length=None)
+
+async def get_budget(budget_id: str, user: dict):
+    budget = await budgets_collection().find_one(
+        {"_id": to_object_id(budget_id, "budget_id"), "user_id": user["userId"]}
+    )
+    if budget is None:
+        raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
+    return budget
+
+async def update_budget(budget_id: str, budget_data: dict, user: dict):
+    current = await get_budget(budget_id, user)
+    budget = {**current, **budget_data}
+    budget["category_id"], budget["category_name"] = await budget_category(budget["category_id"], user)
+    budget["thresholds"] = sorted(set(budget.get("thresholds") or DEFAULT_BUDGET_THRESHOLDS))
+    await budgets_collection().replace_one({"_id": current["_id"]}, budget)
+    # Periodo, límite o categoría pueden haber cambiado: recalcular los contadores
+    await seed_budget_spending(budget)
+    return budget
+
+async def delete_budget(budget_id: str, user: dict):
+    budget = await get_budget(budget_id, user)
+    await budgets_collection().delete_one({"_id": budget["_id"]})
+    await budget_spending_collection().delete_many({"budget_id": budget["_id"]})
+
+async def get_budget_spending(budget: dict, at: datetime = None) -> dict:
+    """Contador del periodo que contiene `at` (ahora por defecto): una lectura por _id compuesto."""
+    start = period_start(at or change_time(), budget["period"])
+    counter = await budget_spending_collection().find_one(
+        {"budget_id": budget["_id"], "period_start": start}
+    )
+    return {"period_start": start, "spent": counter["spent"] if counter else 0}
+
+def budget_expenses(txs: list, sign: int, expenses: dict):
+    # Gasto por (usuario, categoría) y fecha: los ingresos no cuentan
+    for tx in txs:
+        expense = split_amount(tx["amount"])[1]
+        if expense and tx.get("category_id") is not None:
+            expenses.setdefault((tx["user_id"], tx["category_id"]), []).append((tx["date"], sign * expense))
+
+async def apply_to_budgets(added: list, removed: list = ()):
+    """Aplica a los contadores el gasto de las transacciones añadidas menos el de las quitadas.
+
+    Una edición pasa la versión anterior en `removed` y la nueva en `added`: solo
+    se escribe la diferencia neta por (presupuesto, periodo), así que cambiar la
+    descripción no toca el contador ni repite avisos. Si el gasto neto sube, cada
+    umbral cruzado se marca con $addToSet condicional (solo la escritura que lo
+    cruza primero lo notifica); si baja, los umbrales que quedan por debajo se
+    pueden volver a avisar.
+    """
+    expenses = {}
+    budget_expenses(added, 1, expenses)
+    budget_expenses(removed, -1, expenses)
+    if not expenses:
+        return
+
+    budgets = await budgets_collection().find({"$or": [
+        {"user_id": user_id, "category_id": category_id} for user_id, category_id in expenses
+    ]}).to_list(length=None)
+
+    for budget in budgets:
+        by_period = {}
+        for date, expense in expenses[(budget["user_id"], budget["category_id"])]:
+            start = period_start(date, budget["period"])
+            by_period[start] = by_period.get(start, 0) + expense
+
+        for start, amount in by_period.items():
+            # Redondeo para que -10 + 10 (en coma flotante) no cuente como cambio
+            amount = round(amount, 2)
+            if not amount:
+                continue
+            counter = await budget_spending_collection().find_one_and_update(
+                {"budget_id": budget["_id"], "period_start": start},
+                {"$inc": {"spent": amount}, "$setOnInsert": {"user_id": budget["user_id"], "alerted": []}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            if amount < 0:
+                await budget_spending_collection().update_one(
+                    {"_id": counter["_id"]},
+                    {"$pull": {"alerted": {"$gt": counter["spent"] / budget["limit"]}}}
+                )
+                continue
+            for threshold in budget["thresholds"]:
+                if counter["spent"] - amount < threshold * budget["limit"] <= counter["spent"]:
+                    result = await budget_spending_collection().update_one(
+                        {"_id": counter["_id"], "alerted": {"$ne": threshold}},
+                        {"$addToSet": {"alerted": threshold}}
+                    )
+                    if result.modified_count:
+                        await notify_budget_alert(budget, start, counter["spent"], threshold)
@@ -0,0 +1,51 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.config import settings
+from app.core.metrics import mongo_command_metrics
+
+
+class MongoConnection:
+    """Cliente de Motor único por proceso (un solo pool de conexiones).
+
+    main.py lo abre y lo cierra en el lifespan de la app; los comandos de
+    app/commands lo abren bajo demanda la primera vez que se pide la base de datos.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.db = None
+
+    def connect(self, uri: str = None, db_name: str = None):
+        self.client = AsyncIOMotorClient(
+            uri or settings.mongo_uri,
+            maxPoolSize=settings.mongo_max_pool_size,
+            minPoolSize=settings.mongo_min_pool_size,
+            serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+            connectTimeoutMS=settings.mongo_connect_timeout_ms,
+            socketTimeoutMS=settings.mongo_socket_timeout_ms,
+            compressors=settings.mongo_compressors,
+            event_listeners=[mongo_command_metrics],
+        )
+        self.db = self.client[db_name or settings.db_name]
+        return self.db
+
+    def close(self):
+        if self.client:
+            self.client.close()
+        self.client = None
+        self.db = None
+
+
+mongo = MongoConnection()
+
+
+def get_db():
+    """Dependencia de FastAPI con la base de datos compartida.
+
+    crud y las cachés la llaman directamente (no como Depends), así que
+    app.dependency_overrides[get_db] solo afectaría a /stats: para tests la
+    única sustitución soportada es apuntar todo el proceso a otro mongod con
+    mongo.connect(uri, db_name) (o asignar mongo.client/mongo.db, como conftest).
+    """
+    if mongo.db is None:
+        mongo.connect()
+    return mongo.db
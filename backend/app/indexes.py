@@ -0,0 +1,118 @@
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from app.config import settings
+
+# Registro declarativo de índices por colección.
+# ensure_indexes() los crea en el arranque; create_indexes es idempotente
+# cuando el índice ya existe con la misma definición.
+INDEXES = {
+    "transactions": [
+        # Listado paginado por usuario: find({user_id}).sort(date, _id)
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+                   name="user_date_id"),
+        # Filtros por categoría y rango de fechas, recálculo de rollups
+        IndexModel([("user_id", ASCENDING), ("category_id", ASCENDING), ("date", ASCENDING)],
+                   name="user_category_date"),
+        # Listados de admin y stats por rango de fechas sin usuario
+        IndexModel([("date", DESCENDING), ("_id", DESCENDING)], name="date_id"),
+        # Propagación de renombrados de categoría (category_name desnormalizado)
+        IndexModel([("category_id", ASCENDING), ("_id", ASCENDING)], name="category_id_id"),
+        # Sincronización incremental: find({user_id, updated_at > token}).sort(updated_at, _id)
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+                   name="user_updated_id"),
+        IndexModel([("updated_at", ASCENDING), ("_id", ASCENDING)], name="updated_id"),
+    ],
+    "transaction_tombstones": [
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+                   name="user_updated_id"),
+        IndexModel([("updated_at", ASCENDING), ("_id", ASCENDING)], name="updated_id"),
+        # Limpieza de marcas cuando una transacción vuelve a un dueño anterior
+        IndexModel([("tx_id", ASCENDING), ("user_id", ASCENDING)], name="tx_user"),
+        # Las marcas de borrado caducan solas (cambiar el TTL exige borrar el índice)
+        IndexModel([("updated_at", ASCENDING)], name="updated_at_ttl",
+                   expireAfterSeconds=settings.TRANSACTION_TOMBSTONE_TTL_DAYS * 86400),
+    ],
+    "categories": [
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_name"),
+        # Búsqueda por nombre (name_lower normalizado, recorrido de claves) y orden por nombre
+        IndexModel([("user_id", ASCENDING), ("name_lower", ASCENDING)], name="user_name_lower"),
+        IndexModel([("name_lower", ASCENDING)], name="name_lower"),
+        # Búsqueda de texto con relevancia sobre nombre y descripción
+        IndexModel([("name", TEXT), ("description", TEXT)], name="name_description_text",
+                   weights={"name": 10, "description": 1}, default_language="spanish"),
+    ],
+    "budgets": [
+        # Presupuestos afectados por una transacción: find({user_id, category_id})
+        IndexModel([("user_id", ASCENDING), ("category_id", ASCENDING)], name="user_category"),
+    ],
+    "budget_spending": [
+        # Un contador por presupuesto y periodo ($inc con upsert)
+        IndexModel([("budget_id", ASCENDING), ("period_start", ASCENDING)],
+                   name="budget_period", unique=True),
+    ],
+    "revoked_tokens": [
+        # Las revocaciones desaparecen cuando el token habría expirado igualmente
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "email_jobs": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                   expireAfterSeconds=settings.EMAIL_JOB_TTL_DAYS * 86400),
+    ],
+    "transaction_rollups": [
+        IndexModel([("user_id", ASCENDING), ("category_id", ASCENDING),
+                    ("year", ASCENDING), ("month", ASCENDING)],
+                   name="rollup_key", unique=True),
+        IndexModel([("ym", ASCENDING)], name="ym"),
+        IndexModel([("user_id", ASCENDING), ("ym", ASCENDING)], name="user_ym"),
+    ],
+}
+
+# Consultas calientes que nunca deberían acabar en COLLSCAN.
+# (colección, filtro, orden)
+HOT_QUERIES = [
+    ("transactions", {"user_id": 1}, [("date", DESCENDING), ("_id", DESCENDING)]),
+    ("transactions", {"user_id": 1, "date": {"$gte": 0}}, [("date", DESCENDING), ("_id", DESCENDING)]),
+    ("transactions", {"user_id": 1, "category_id": "x", "date": {"$gte": 0}}, None),
+    ("transactions", {"date": {"$gte": 0}}, [("date", DESCENDING), ("_id", DESCENDING)]),
+    ("transactions", {"user_id": 1, "updated_at": {"$gt": 0}}, [("updated_at", ASCENDING), ("_id", ASCENDING)]),
+    ("transaction_tombstones", {"user_id": 1, "updated_at": {"$gt": 0}}, [("updated_at", ASCENDING), ("_id", ASCENDING)]),
+    ("categories", {"user_id": 1}, None),
+    ("categories", {"user_id": 1, "name_lower": {"$regex": "ali"}}, [("name_lower", ASCENDING)]),
+    ("transaction_rollups", {"user_id": 1, "category_id": "x", "year": 2024, "month": 1}, None),
+    ("transaction_rollups", {"ym": {"$gte": 202401}}, None),
+    ("budgets", {"user_id": 1, "category_id": "x"}, None),
+    ("budget_spending", {"budget_id": "x", "period_start": 0}, None),
+]
+
+
+async def ensure_indexes(db):
+    for collection, indexes in INDEXES.items():
+        await db[collection].create_indexes(indexes)
+
+
+def plan_stages(plan: dict):
+    """Recorre el árbol de un winningPlan y devuelve todas sus etapas."""
+    stages = [plan.get("stage")]
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            stages += plan_stages(plan[child])
+    for sub in plan.get("inputStages", []):
+        stages += plan_stages(sub)
+    return stages
+
+
+async def explain_stages(db, collection: str, query: dict, sort=None):
+    cursor = db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explain = await cursor.explain()
+    return plan_stages(explain["queryPlanner"]["winningPlan"])
+
+
+async def find_collscans(db, queries=HOT_QUERIES):
+    """Devuelve las consultas de la lista cuyo plan ganador usa COLLSCAN."""
+    regressions = []
+    for collection, query, sort in queries:
+        stages = await explain_stages(db, collection, query, sort)
+        if "COLLSCAN" in stages:
+            regressions.append((collection, query, sort))
+    return regressions
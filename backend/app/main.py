@@ -1,16 +1,60 @@
-from fastapi import FastAPI
+import hmac
+import logging
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 ##la carpeta api quedará obsoleta en detrimento de routes.
 ##estamos migrando componentes poco a poco.
 from app.api import users
 ##
+from app.db import mongo
+from app.core.auth import check_jwt_secret
+from app.core.invalidation import change_stream_watcher
+from app.core.logging_config import setup_logging
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, metrics
 from app.config import settings
-from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.user_directory import user_directory
+from app.crud import backfill_name_lower
+from app.indexes import ensure_indexes
+from app.utils.email_sender import email_queue
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import finanzas, categories, transactions, stats
+from app.routes import finanzas, categories, transactions, stats, budgets
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI(title="Finanzas Personales Backend")
+setup_logging(settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Conexiones compartidas: se abren al arrancar y se cierran al parar
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fallar al arrancar si JWT_SECRET usa el valor por defecto
+    check_jwt_secret()
+    # Cliente único de MongoDB (app.db.get_db lo expone a routers y crud)
+    db = mongo.connect()
+    logger.info("MongoDB connected!")
+    # Índices declarados en app/indexes.py (idempotente)
+    await ensure_indexes(db)
+    # Categorías antiguas sin name_lower (no saldrían al buscar por nombre)
+    backfilled = await backfill_name_lower()
+    if backfilled:
+        logger.info("name_lower rellenado en categorías antiguas", extra={"categories": backfilled})
+    # Pool de Postgres para el directorio de usuarios
+    await user_directory.connect()
+    # Workers de la cola de emails
+    email_queue.start()
+    # Invalidación de cachés entre workers vía change streams
+    if settings.mongo_change_streams:
+        change_stream_watcher.start(db)
+
+    yield
+
+    await change_stream_watcher.stop()
+    await email_queue.stop()
+    await user_directory.close()
+    mongo.close()
+
+app = FastAPI(title="Finanzas Personales Backend", lifespan=lifespan)
 app.include_router(finanzas.router)
 app.include_router(categories.router)
 app.include_router(transactions.router)
@@ -27,31 +71,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],       # GET, POST, PUT, DELETE
     allow_headers=["*"],       # Content-Type, Authorization...
+    # Paginación de /transactions/ y /categories/, sincronización incremental, caché de /stats
+    expose_headers=["X-Next-Cursor", "X-Next-Offset", "X-Change-Token", "ETag", "Last-Modified"],
 )
-
-# Conexión a MongoDB
-@app.on_event("startup")
-async def startup_db_client():
-    app.mongodb_client = AsyncIOMotorClient(settings.mongo_uri)
-    app.mongodb = app.mongodb_client[settings.db_name]
-    print("MongoDB connected!")
-
-# Cerrar conexión a MongoDB
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    app.mongodb_client.close()
+# Latencia y tamaño de respuesta por ruta (fuera de CORS: mide la petición completa)
+app.add_middleware(MetricsMiddleware)
 
 # Incluir routers
 app.include_router(users.router)
 app.include_router(categories.router)
 app.include_router(transactions.router)
 app.include_router(stats.router)
+app.include_router(budgets.router)
 
 # Endpoint de prueba
 @app.get("/test")
 async def test():
     return {"status": "ok"}
 
+def metrics_token_required(request: Request):
+    # Las métricas exponen rutas y volumen de tráfico: solo con METRICS_TOKEN
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+
+# Métricas en formato Prometheus (por proceso)
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(metrics_token_required)])
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
 # Endpoint de healthcheck
 @app.get("/health")
 async def healthcheck():
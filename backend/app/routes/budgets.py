@@ -0,0 +1,59 @@
+# app/routes/budgets.py
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends
+from app.schemas import BudgetCreate, BudgetOut
+from app.crud import (
+    create_budget,
+    get_budgets,
+    get_budget,
+    update_budget,
+    delete_budget,
+    get_budget_spending,
+    normalize_date
+)
+from app.core.auth import verify_token
+
+
+router = APIRouter(prefix="/budgets", tags=["budgets"])
+
+async def budget_out(budget: dict, at: datetime = None) -> dict:
+    # Gastado en el periodo: lectura directa del contador, sin agregaciones
+    spending = await get_budget_spending(budget, at)
+    return {
+        "id": str(budget["_id"]),
+        "category_id": str(budget["category_id"]),
+        "category_name": budget.get("category_name"),
+        "period": budget["period"],
+        "limit": budget["limit"],
+        "thresholds": budget["thresholds"],
+        "period_start": spending["period_start"],
+        "spent": spending["spent"],
+        "remaining": budget["limit"] - spending["spent"],
+    }
+
+# GET presupuestos del usuario con el gasto del periodo actual (o del que contiene `at`)
+@router.get("/", response_model=List[BudgetOut])
+async def list_budgets(at: Optional[datetime] = None, decoded=Depends(verify_token)):
+    at = normalize_date(at) if at else None
+    return [await budget_out(budget, at) for budget in await get_budgets(decoded)]
+
+@router.get("/{budget_id}", response_model=BudgetOut)
+async def get_single_budget(budget_id: str, at: Optional[datetime] = None, decoded=Depends(verify_token)):
+    return await budget_out(await get_budget(budget_id, decoded), normalize_date(at) if at else None)
+
+# POST crear presupuesto (calcula los contadores de los periodos existentes)
+@router.post("/", response_model=BudgetOut)
+async def create_new_budget(budget: BudgetCreate, decoded=Depends(verify_token)):
+    return await budget_out(await create_budget(budget.model_dump(), decoded))
+
+# PUT actualizar presupuesto
+@router.put("/{budget_id}", response_model=BudgetOut)
+async def update_existing_budget(budget_id: str, budget: BudgetCreate, decoded=Depends(verify_token)):
+    return await budget_out(await update_budget(budget_id, budget.model_dump(), decoded))
+
+# DELETE eliminar presupuesto
+@router.delete("/{budget_id}")
+async def delete_existing_budget(budget_id: str, decoded=Depends(verify_token)):
+    await delete_budget(budget_id, decoded)
+    return {"message": "Presupuesto eliminado"}
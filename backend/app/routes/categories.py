@@ -1,22 +1,28 @@
 # app/routes/categories.py
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Response, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from app.schemas import CategoryCreate, CategoryOut
 from app.crud import (
-    create_category, get_categories,  
-    update_category, delete_category, get_categories_filtered
+    create_category,
+    update_category, delete_category, get_categories_filtered,
+    find_categories_filtered
 )
 from app.core.auth import verify_token
-from app.utils.email_sender import send_email
+from app.utils.email_sender import email_queue
+from app.utils.csv_stream import iter_batches, stream_csv, csv_response
+from app.utils.fast_json import FastJSONResponse
 
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
-@router.get("/", response_model=List[CategoryOut])
+@router.get("/", response_model=List[CategoryOut], response_class=FastJSONResponse)
 async def list_categories(
     name: Optional[str] = Query(None),
     description: Optional[str] = Query(None),
+    q: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=5000),
+    offset: int = Query(0, ge=0),
     decoded=Depends(verify_token)
 ):
     # Construir filtros
@@ -25,19 +31,29 @@ async def list_categories(
         filters['name'] = name
     if description:
         filters['description'] = description
+    if q:
+        filters['q'] = q
     
-    # Obtener categorías filtradas
-    cats = await get_categories_filtered(decoded, filters)
+    # Obtener categorías filtradas (una de más para saber si hay otra página)
+    cats = await get_categories_filtered(decoded, filters, limit + 1, offset)
+    headers = None
+    if len(cats) > limit:
+        cats = cats[:limit]
+        headers = {"X-Next-Offset": str(offset + limit)}
     
-    return [
-        {
-            "id": str(cat["_id"]), 
-            "name": cat["name"], 
-            "description": cat.get("description", ""),
-            "user_id": cat.get("user_id", "")
-        }
-        for cat in cats
-    ]
+    # Sin revalidación de CategoryOut: los tipos se fijan aquí (user_id como str)
+    return FastJSONResponse(
+        [
+            {
+                "id": str(cat["_id"]), 
+                "name": cat["name"], 
+                "description": cat.get("description", ""),
+                "user_id": str(cat.get("user_id", ""))
+            }
+            for cat in cats
+        ],
+        headers=headers
+    )
 
 # POST crear categoría
 @router.post("/", response_model=CategoryOut)
@@ -68,33 +84,39 @@ async def delete_existing_category(cat_id: str, decoded=Depends(verify_token)):
 async def export_categories_csv(
     decoded=Depends(verify_token),
     name: Optional[str] = None,
-    description: Optional[str] = None
+    description: Optional[str] = None,
+    q: Optional[str] = None,
+    gzip: bool = False
 ):
     try:
-        # Construir filtros
+        # Construir filtros (mismo formato que el listado)
         filters = {}
         if name:
-            filters["name"] = {"$regex": name, "$options": "i"}
+            filters["name"] = name
         if description:
-            filters["description"] = {"$regex": description, "$options": "i"}
+            filters["description"] = description
+        if q:
+            filters["q"] = q
 
-        # Usar función filtrada
-        categories = await get_categories_filtered(decoded, filters)
+        cursor = find_categories_filtered(decoded, filters)
 
-        csv_data = "Nombre,Descripción,Usuario\n"
-        for cat in categories:
-            csv_data += f'"{cat["name"]}","{cat.get("description", "")}","{cat["user_id"]}"\n'
+        async def rows():
+            async for batch in iter_batches(cursor):
+                yield [
+                    [cat["name"], cat.get("description") or "", cat["user_id"]]
+                    for cat in batch
+                ]
 
         filename = f"categorias_{datetime.now().strftime('%Y%m%d')}.csv"
-        return Response(
-            content=csv_data,
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        return csv_response(
+            stream_csv(["Nombre", "Descripción", "Usuario"], rows(), gzip),
+            filename,
+            gzip
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exportando categorías: {str(e)}")
 
-@router.post("/export/email")
+@router.post("/export/email", status_code=202)
 async def export_categories_email(request: dict, decoded=Depends(verify_token)):
     try:
         csv_data = request.get("csv_data", "")
@@ -149,14 +171,17 @@ async def export_categories_email(request: dict, decoded=Depends(verify_token)):
         </div>
         """
 
-        await send_email(
+        job_id = await email_queue.enqueue(
             decoded["email"],
             "Reporte de Categorías Finanzas",
             html_body,
-            csv_data
+            csv_data,
+            filename="categorias.csv"
         )
         
-        return {"status": "success", "message": f"Email enviado a {decoded['email']}"}
+        return {"status": "queued", "job_id": job_id, "message": f"Email en cola para {decoded['email']}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error enviando email: {str(e)}")
     
\ No newline at end of file
@@ -1,5 +1,9 @@
-from fastapi import APIRouter, Depends
-from app.core.auth import admin_required
+from fastapi import APIRouter, Depends, HTTPException, Request
+from app.core.auth import admin_required, verify_token, get_bearer_token, token_cache, revoke_token
+from app.core.user_directory import user_directory
+from app.core.category_names import category_names
+from app.core.stats_cache import stats_cache
+from app.utils.email_sender import email_queue
 
 router = APIRouter(prefix="/finanzas", tags=["finanzas"])
 
@@ -7,3 +11,27 @@ router = APIRouter(prefix="/finanzas", tags=["finanzas"])
 def get_dashboard(user=Depends(admin_required)):
     return {"message": f"Acceso permitido a {user['email']}"}
 
+
+@router.get("/cache")
+def get_cache_stats(user=Depends(admin_required)):
+    return {
+        "users": user_directory.stats(),
+        "categories": category_names.stats(),
+        "tokens": token_cache.stats(),
+        "stats": stats_cache.stats(),
+    }
+
+# Revoca el token de la petición (logout) en todos los workers: se guarda en
+# revoked_tokens hasta su exp y los demás lo ven por change stream (o al
+# caducar su caché, JWT_CACHE_MAX_AGE)
+@router.post("/tokens/revoke")
+async def revoke_current_token(request: Request, user=Depends(verify_token)):
+    await revoke_token(get_bearer_token(request), user.get("exp"))
+    return {"status": "revoked"}
+
+@router.get("/email/{job_id}")
+async def get_email_job(job_id: str, user=Depends(verify_token)):
+    job = await email_queue.status(job_id)
+    if not job or job.get("to") != user.get("email"):
+        raise HTTPException(status_code=404, detail="Envío no encontrado")
+    return {"job_id": job_id, "status": job["status"], "attempts": job["attempts"]}
@@ -1,5 +1,13 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas import StatsByUser, StatsByCategory, StatsOverTime
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from email.utils import format_datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from app.schemas import StatsByUser, StatsByCategory, StatsOverTime, StatsTimeSeries, StatsDashboard
+from app.core.auth import admin_required, verify_token
+from app.core.stats_cache import stats_cache
+from app.db import get_db
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
@@ -9,34 +17,94 @@ def fix_id(doc):
     del doc["_id"]
     return doc
 
+def parse_utc(value: str) -> datetime:
+    # Fechas en UTC sin tzinfo, igual que las devuelve MongoDB
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def month_key(d: datetime) -> int:
+    return d.year * 100 + d.month
+
+def user_match(decoded: dict) -> dict:
+    # Los admins ven todo; el resto solo sus propios datos
+    if decoded.get("role") == "admin":
+        return {}
+    return {"user_id": decoded["userId"]}
+
+async def resolve_usernames(rows: list) -> dict:
+    """Usernames de Postgres solo para las filas agrupadas sin username desnormalizado."""
+    from app.core.user_directory import user_directory
+    missing = {r["_id"] for r in rows if not r.get("username")}
+    return await user_directory.get_usernames(missing) if missing else {}
+
+async def resolve_category_names(db, rows: list) -> dict:
+    """Nombres de categorías existentes para las filas agrupadas sin category_name."""
+    missing = [r["_id"] for r in rows if not r.get("category_name")]
+    if not missing:
+        return {}
+    cursor = db.categories.find({"_id": {"$in": missing}}, {"name": 1})
+    return {cat["_id"]: cat["name"] async for cat in cursor}
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    # Solo If-None-Match: con la resolución de segundos de If-Modified-Since dos
+    # escrituras en el mismo segundo darían un 304 con datos viejos
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+async def cached_stats(request: Request, decoded: dict, endpoint: str, params: tuple, compute):
+    """Sirve un endpoint de /stats desde la caché por versión de datos, con ETag/304."""
+    scope = stats_cache.scope(decoded)
+    version, last_modified = await stats_cache.version(scope)
+    key = (scope, endpoint, params)
+    etag = stats_cache.etag(key, version)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+    }
+    if last_modified:
+        # Informativo: la revalidación va por ETag
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    # Datos sin cambios desde la última visita: 304 con solo la lectura de la versión
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    payload = stats_cache.get(key, version)
+    if payload is None:
+        payload = await compute()
+        stats_cache.put(key, version, payload)
+    return JSONResponse(payload, headers=headers)
+
 # --- Endpoints ---
 @router.get("/by-user", response_model=list[StatsByUser])
-async def stats_by_user():
-    from app.main import app
-    db = app.mongodb
-    
-    # 1. Obtener transacciones agrupadas por user_id de MongoDB
+async def stats_by_user(request: Request, decoded=Depends(verify_token), db=Depends(get_db)):
+    return await cached_stats(
+        request, decoded, "by-user", (), lambda: compute_by_user(db, user_match(decoded))
+    )
+
+async def compute_by_user(db, match: dict):
+    # 1. Obtener totales por user_id desde los rollups de MongoDB (con el username desnormalizado)
     pipeline = [
-        {"$group": {"_id": "$user_id", "total": {"$sum": "$amount"}}}
+        {"$match": match},
+        {"$group": {"_id": "$user_id", "total": {"$sum": "$sum"}, "username": {"$max": "$username"}}}
     ]
     
-    transaction_totals = await db.transactions.aggregate(pipeline).to_list(length=None)
+    transaction_totals = await db.transaction_rollups.aggregate(pipeline).to_list(length=None)
     
     if not transaction_totals:
         raise HTTPException(status_code=404, detail="No stats found")
     
-    # 2. Obtener usuarios de PostgreSQL
-    from app.crud import get_users_from_postgres
-    pg_users = await get_users_from_postgres()
-    
-    # Crear mapeo de usuarios
-    user_map = {str(user['id']): user['username'] for user in pg_users}
+    # 2. Obtener de PostgreSQL solo los usuarios sin username en los rollups
+    user_map = await resolve_usernames(transaction_totals)
     
     # 3. Combinar datos
     result = []
     for tx in transaction_totals:
         user_id = str(tx["_id"])
-        username = user_map.get(user_id, "Usuario Desconocido")
+        username = tx.get("username") or user_map.get(user_id, "Usuario Desconocido")
         
         result.append({
             "user_id": user_id,
@@ -47,80 +115,395 @@ async def stats_by_user():
     return result
 
 @router.get("/by-category", response_model=list[StatsByCategory])
-async def stats_by_category():
-    from app.main import app
-    db = app.mongodb
+async def stats_by_category(request: Request, decoded=Depends(verify_token), db=Depends(get_db)):
+    return await cached_stats(
+        request, decoded, "by-category", (), lambda: compute_by_category(db, user_match(decoded))
+    )
+
+async def compute_by_category(db, match: dict):
+    # Agrupar sobre los rollups, que ya llevan category_name desnormalizado
     pipeline = [
-    {
-        "$addFields": {
-            "category_id_obj": {"$toObjectId": "$category_id"}  # convierte string a ObjectId
-        }
-    },
+    {"$match": match},
     {
         "$group": {
-            "_id": "$category_id_obj",
-            "total": {"$sum": "$amount"}
-        }
-    },
-    {
-        "$lookup": {
-            "from": "categories",
-            "localField": "_id",
-            "foreignField": "_id",
-            "as": "category"
-        }
-    },
-    {"$unwind": "$category"},
-    {
-        "$project": {
-            "category_id": "$_id",
-            "category_name": "$category.name",
-            "total": 1
+            "_id": "$category_id",
+            "total": {"$sum": "$sum"},
+            "category_name": {"$max": "$category_name"}
         }
     }
 ]
-    result = await db.transactions.aggregate(pipeline).to_list(length=None)
-    if not result:
-        raise HTTPException(status_code=404, detail="No stats found")
-    
-    result = sorted(result, key=lambda x: x["category_name"].lower())
-    return [
+    grouped = await db.transaction_rollups.aggregate(pipeline).to_list(length=None)
+    category_map = await resolve_category_names(db, grouped)
+
+    # Las categorías borradas (sin nombre) no se muestran
+    result = [
         {
-            "category_id": str(r["category_id"]),
-            "category_name": r["category_name"],
+            "category_id": str(r["_id"]),
+            "category_name": r.get("category_name") or category_map[r["_id"]],
             "total": r["total"]
         }
-        for r in result
+        for r in grouped
+        if r.get("category_name") or r["_id"] in category_map
     ]
+    if not result:
+        raise HTTPException(status_code=404, detail="No stats found")
+    
+    return sorted(result, key=lambda x: x["category_name"].lower())
 
 @router.get("/over-time", response_model=list[StatsOverTime])
-async def stats_over_time(start: str = None, end: str = None):
-    from app.main import app
-    from datetime import datetime, timezone
-    db = app.mongodb
-
-    match_stage = {}
-    if start:
-        match_stage["$gte"] = datetime.fromisoformat(start).replace(tzinfo=timezone.utc)
-    if end:
-        match_stage["$lte"] = datetime.fromisoformat(end).replace(tzinfo=timezone.utc)
-
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": {"date": match_stage}})
-
-    pipeline.append({
-        "$group": {
-            "_id": {"year": {"$year": "$date"}, "month": {"$month": "$date"}},
-            "total": {"$sum": "$amount"}
-        }
-    })
-    pipeline.append({"$sort": {"_id.year": 1, "_id.month": 1}})
+async def stats_over_time(
+    request: Request,
+    start: str = None,
+    end: str = None,
+    decoded=Depends(verify_token),
+    db=Depends(get_db)
+):
+    return await cached_stats(
+        request, decoded, "over-time", (start, end),
+        lambda: compute_over_time(db, user_match(decoded), start, end)
+    )
 
-    result = await db.transactions.aggregate(pipeline).to_list(length=None)
-    if not result:
+def split_month_range(start_dt: datetime = None, end_dt: datetime = None):
+    """Divide [start_dt, end_dt] en meses completos y extremos parciales.
+
+    Devuelve (rollup_range, raw_ranges): el filtro sobre ym de los rollups
+    (None si no hay meses completos) y los rangos de fechas que hay que
+    agregar directamente sobre transactions.
+    """
+    from app.crud import month_range
+
+    # Los meses completos salen de los rollups; los meses parciales de los
+    # extremos del rango se agregan directamente sobre transactions.
+    rollup_range = {}
+    raw_ranges = []
+    if start_dt and end_dt and month_key(start_dt) == month_key(end_dt):
+        raw_ranges.append({"$gte": start_dt, "$lte": end_dt})
+        rollup_range = None
+    else:
+        if start_dt:
+            month_start, next_month = month_range(start_dt.year, start_dt.month)
+            if start_dt == month_start:
+                rollup_range["$gte"] = month_key(start_dt)
+            else:
+                raw_ranges.append({"$gte": start_dt, "$lt": next_month})
+                rollup_range["$gte"] = month_key(next_month)
+        if end_dt:
+            month_start, _ = month_range(end_dt.year, end_dt.month)
+            raw_ranges.append({"$gte": month_start, "$lte": end_dt})
+            rollup_range["$lt"] = month_key(end_dt)
+    return rollup_range, raw_ranges
+
+async def compute_over_time(db, match: dict, start: str = None, end: str = None):
+    start_dt = parse_utc(start) if start else None
+    end_dt = parse_utc(end) if end else None
+    rollup_range, raw_ranges = split_month_range(start_dt, end_dt)
+
+    totals = {}
+    if rollup_range is not None:
+        rollup_match = dict(match)
+        if rollup_range:
+            rollup_match["ym"] = rollup_range
+        pipeline = [{"$match": rollup_match}]
+        pipeline.append({
+            "$group": {
+                "_id": {"year": "$year", "month": "$month"},
+                "total": {"$sum": "$sum"}
+            }
+        })
+        async for r in db.transaction_rollups.aggregate(pipeline):
+            key = (r["_id"]["year"], r["_id"]["month"])
+            totals[key] = totals.get(key, 0) + r["total"]
+
+    if raw_ranges:
+        pipeline = [
+            {"$match": {**match, "$or": [{"date": r} for r in raw_ranges]}},
+            {"$group": {
+                "_id": {"year": {"$year": "$date"}, "month": {"$month": "$date"}},
+                "total": {"$sum": "$amount"}
+            }}
+        ]
+        async for r in db.transactions.aggregate(pipeline):
+            key = (r["_id"]["year"], r["_id"]["month"])
+            totals[key] = totals.get(key, 0) + r["total"]
+
+    if not totals:
         raise HTTPException(status_code=404, detail="No stats found")    
     return [
-        {"year": r["_id"]["year"], "month": r["_id"]["month"], "total": r["total"]}
-        for r in result
+        {"year": year, "month": month, "total": total}
+        for (year, month), total in sorted(totals.items())
     ]
+
+# --- Dashboard: las tres vistas y los totales en una sola agregación ---
+DASHBOARD_FACET = {"$facet": {
+    "by_user": [{"$group": {"_id": "$user_id", "total": {"$sum": "$sum"}, "username": {"$max": "$username"}}}],
+    "by_category": [{"$group": {"_id": "$category_id", "total": {"$sum": "$sum"},
+                                "category_name": {"$max": "$category_name"}}}],
+    "over_time": [{"$group": {"_id": {"year": "$year", "month": "$month"}, "total": {"$sum": "$sum"}}}],
+    "totals": [{"$group": {
+        "_id": None,
+        "net": {"$sum": "$sum"},
+        "count": {"$sum": "$count"},
+        # Rollups anteriores a income/expense: rebuild_rollups los rellena
+        "income": {"$sum": {"$ifNull": ["$income", 0]}},
+        "expense": {"$sum": {"$ifNull": ["$expense", 0]}},
+    }}],
+}}
+
+# Cada transacción con la misma forma que un cubo de rollups
+RAW_AS_ROLLUP = {"$project": {
+    "user_id": 1,
+    "category_id": 1,
+    "username": 1,
+    "category_name": 1,
+    "year": {"$year": "$date"},
+    "month": {"$month": "$date"},
+    "sum": "$amount",
+    "count": {"$literal": 1},
+    "income": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]},
+    "expense": {"$cond": [{"$lt": ["$amount", 0]}, {"$multiply": ["$amount", -1]}, 0]},
+}}
+
+@router.get("/dashboard", response_model=StatsDashboard)
+async def stats_dashboard(
+    request: Request,
+    start: str = None,
+    end: str = None,
+    decoded=Depends(verify_token),
+    db=Depends(get_db)
+):
+    return await cached_stats(
+        request, decoded, "dashboard", (start, end),
+        lambda: compute_dashboard(db, user_match(decoded), start, end)
+    )
+
+async def compute_dashboard(db, match: dict, start: str = None, end: str = None):
+    start_dt = parse_utc(start) if start else None
+    end_dt = parse_utc(end) if end else None
+    rollup_range, raw_ranges = split_month_range(start_dt, end_dt)
+
+    # Mismo $match y mismo $facet sobre los meses completos (rollups) y sobre
+    # los extremos parciales (transactions); los resultados se suman aquí.
+    aggregations = []
+    if rollup_range is not None:
+        rollup_match = {**match, "ym": rollup_range} if rollup_range else match
+        aggregations.append(db.transaction_rollups.aggregate([{"$match": rollup_match}, DASHBOARD_FACET]))
+    if raw_ranges:
+        raw_match = {**match, "$or": [{"date": r} for r in raw_ranges]}
+        aggregations.append(db.transactions.aggregate([{"$match": raw_match}, RAW_AS_ROLLUP, DASHBOARD_FACET]))
+
+    by_user, by_category, over_time = {}, {}, {}
+    totals = {"count": 0, "income": 0, "expense": 0, "net": 0}
+    for aggregation in aggregations:
+        facets = (await aggregation.to_list(length=1))[0]
+        for view, rows, name in ((by_user, facets["by_user"], "username"),
+                                 (by_category, facets["by_category"], "category_name")):
+            for r in rows:
+                merged = view.setdefault(r["_id"], {"_id": r["_id"], "total": 0, name: None})
+                merged["total"] += r["total"]
+                merged[name] = merged[name] or r.get(name)
+        for r in facets["over_time"]:
+            key = (r["_id"]["year"], r["_id"]["month"])
+            over_time[key] = over_time.get(key, 0) + r["total"]
+        for r in facets["totals"]:
+            for field in totals:
+                totals[field] += r[field]
+
+    # Nombres desnormalizados; solo los que faltan se resuelven, una vez por respuesta
+    user_map, category_map = await asyncio.gather(
+        resolve_usernames(by_user.values()),
+        resolve_category_names(db, by_category.values()),
+    )
+
+    users = [
+        {"user_id": str(r["_id"]),
+         "username": r["username"] or user_map.get(str(r["_id"]), "Usuario Desconocido"),
+         "total": r["total"]}
+        for r in by_user.values()
+    ]
+    categories = [
+        {"category_id": str(r["_id"]),
+         "category_name": r["category_name"] or category_map.get(r["_id"], "Categoría Desconocida"),
+         "total": r["total"]}
+        for r in by_category.values()
+    ]
+    return {
+        "totals": totals,
+        "by_user": sorted(users, key=lambda x: x["username"].lower()),
+        "by_category": sorted(categories, key=lambda x: x["category_name"].lower()),
+        "over_time": [
+            {"year": year, "month": month, "total": total}
+            for (year, month), total in sorted(over_time.items())
+        ],
+    }
+
+# --- Serie temporal acumulada ---
+MAX_TIMESERIES_BUCKETS = 10000
+
+def truncate_local(local: datetime, granularity: str) -> datetime:
+    # Mismo criterio que $dateTrunc (semanas empezando en lunes)
+    day = local.date()
+    if granularity == "week":
+        day -= timedelta(days=day.weekday())
+    elif granularity == "month":
+        day = day.replace(day=1)
+    return datetime.combine(day, time(), tzinfo=local.tzinfo)
+
+def next_bucket(local: datetime, granularity: str) -> datetime:
+    day = local.date()
+    if granularity == "day":
+        day += timedelta(days=1)
+    elif granularity == "week":
+        day += timedelta(days=7)
+    else:
+        day = date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+    # Medianoche local del siguiente cubo (respeta los cambios de horario)
+    return datetime.combine(day, time(), tzinfo=local.tzinfo)
+
+def bucket_starts(first: datetime, last: datetime, granularity: str, tz: ZoneInfo):
+    """Inicios de cubo (UTC sin tzinfo) entre first y last, ambos incluidos."""
+    local = truncate_local(first.replace(tzinfo=timezone.utc).astimezone(tz), granularity)
+    buckets = []
+    while True:
+        bucket = local.astimezone(timezone.utc).replace(tzinfo=None)
+        if bucket > last:
+            return buckets
+        buckets.append(bucket)
+        if len(buckets) > MAX_TIMESERIES_BUCKETS:
+            raise HTTPException(status_code=400, detail="Demasiados intervalos: usa una granularidad mayor")
+        local = next_bucket(local, granularity)
+
+def epoch_ms(d: datetime) -> int:
+    return int(d.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+async def opening_balance(db, match: dict, start_dt: datetime, split: bool) -> dict:
+    """Saldo anterior a start_dt: meses completos desde rollups y el mes parcial desde transactions."""
+    from app.crud import month_range
+    month_start, _ = month_range(start_dt.year, start_dt.month)
+    group_id = "$category_id" if split else None
+    balances = {}
+    pipelines = [
+        (db.transaction_rollups, [
+            {"$match": {**match, "ym": {"$lt": month_key(start_dt)}}},
+            {"$group": {"_id": group_id, "total": {"$sum": "$sum"}}},
+        ]),
+        (db.transactions, [
+            {"$match": {**match, "date": {"$gte": month_start, "$lt": start_dt}}},
+            {"$group": {"_id": group_id, "total": {"$sum": "$amount"}}},
+        ]),
+    ]
+    for collection, pipeline in pipelines:
+        async for r in collection.aggregate(pipeline):
+            balances[r["_id"]] = balances.get(r["_id"], 0) + r["total"]
+    return balances
+
+@router.get("/timeseries", response_model=StatsTimeSeries)
+async def stats_timeseries(
+    request: Request,
+    granularity: str = Query("month", pattern="^(day|week|month)$"),
+    tz: str = "UTC",
+    start: str = None,
+    end: str = None,
+    by_category: bool = False,
+    decoded=Depends(verify_token),
+    db=Depends(get_db)
+):
+    return await cached_stats(
+        request, decoded, "timeseries", (granularity, tz, start, end, by_category),
+        lambda: compute_timeseries(db, user_match(decoded), granularity, tz, start, end, by_category)
+    )
+
+async def compute_timeseries(db, match: dict, granularity: str, tz: str,
+                             start: str = None, end: str = None, split: bool = False):
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Zona horaria no válida")
+
+    start_dt = parse_utc(start) if start else None
+    end_dt = parse_utc(end) if end else None
+    date_range = {}
+    if start_dt:
+        date_range["$gte"] = start_dt
+    if end_dt:
+        date_range["$lte"] = end_dt
+
+    trunc = {"date": "$date", "unit": granularity, "timezone": tz}
+    if granularity == "week":
+        trunc["startOfWeek"] = "monday"
+    group_id = {"bucket": {"$dateTrunc": trunc}}
+    if split:
+        group_id["category_id"] = "$category_id"
+
+    window = {
+        "sortBy": {"_id.bucket": 1},
+        "output": {"cumulative": {"$sum": "$value", "window": {"documents": ["unbounded", "current"]}}},
+    }
+    if split:
+        window["partitionBy"] = "$_id.category_id"
+
+    pipeline = [
+        {"$match": {**match, "date": date_range} if date_range else match},
+        {"$group": {"_id": group_id, "value": {"$sum": "$amount"}}},
+        # Suma acumulada por serie calculada en MongoDB
+        {"$setWindowFields": window},
+    ]
+
+    points = {}  # serie -> {cubo: (valor, acumulado)}
+    first = last = None
+    async for r in db.transactions.aggregate(pipeline):
+        bucket = r["_id"]["bucket"]
+        points.setdefault(r["_id"].get("category_id"), {})[bucket] = (r["value"], r["cumulative"])
+        first = bucket if first is None or bucket < first else first
+        last = bucket if last is None or bucket > last else last
+
+    if first is None and not start_dt:
+        raise HTTPException(status_code=404, detail="No stats found")
+
+    # Rellenar huecos: los cubos vacíos valen 0 y mantienen el acumulado.
+    # Con start y sin movimientos en el rango, la serie es plana en el saldo inicial
+    opening = await opening_balance(db, match, start_dt, split) if start_dt else {}
+    range_end = end_dt or last or max(start_dt, datetime.now(timezone.utc).replace(tzinfo=None))
+    buckets = bucket_starts(start_dt or first, range_end, granularity, zone)
+
+    # Series con movimientos en el rango y, con start, las que solo tienen saldo inicial
+    keys = list(points) + [key for key in opening if key not in points]
+    if not split and not keys:
+        keys = [None]
+
+    series = []
+    for key in keys:
+        values_by_bucket = points.get(key, {})
+        offset = opening.get(key, 0)
+        values, cumulative = [], []
+        running = offset
+        for bucket in buckets:
+            value, total = values_by_bucket.get(bucket, (0, None))
+            if total is not None:
+                running = offset + total
+            values.append(value)
+            cumulative.append(running)
+        series.append({"category_id": key, "values": values, "cumulative": cumulative})
+
+    result = {"granularity": granularity, "timezone": tz, "timestamps": [epoch_ms(b) for b in buckets]}
+    if not split:
+        result["values"] = series[0]["values"]
+        result["cumulative"] = series[0]["cumulative"]
+        return result
+
+    names = {
+        cat["_id"]: cat["name"]
+        async for cat in db.categories.find({"_id": {"$in": keys}}, {"name": 1})
+    }
+    for item in series:
+        item["category_name"] = names.get(item["category_id"], "Unknown")
+        item["category_id"] = str(item["category_id"])
+    result["series"] = sorted(series, key=lambda x: x["category_name"].lower())
+    return result
+
+@router.post("/rollups/rebuild")
+async def rebuild_stats_rollups(decoded=Depends(admin_required)):
+    from app.crud import rebuild_rollups
+    # Solo en mantenimiento: las escrituras durante el recálculo se pierden.
+    # rebuild_rollups invalida las stats de todos los ámbitos
+    buckets = await rebuild_rollups()
+    return {"status": "ok", "buckets": buckets}
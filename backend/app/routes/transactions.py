@@ -1,56 +1,203 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Response
+import logging
+import re
+from datetime import datetime, timedelta
+from html import escape
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from pydantic import ValidationError
 from typing import List, Optional
-from app.schemas import TransactionCreate, TransactionOut
+from app.schemas import TransactionCreate, TransactionOut, TransactionChanges, BulkImportResult
 from app.crud import (
     create_transaction,
     get_transactions,
+    get_transaction_changes,
+    initial_change_token,
     update_transaction,
     delete_transaction,
-    get_users_from_postgres,
-    get_categories,
-    get_transactions_filtered
+    find_transactions_filtered,
+    get_transactions_summary,
+    get_category_ids,
+    insert_transactions_bulk,
+    normalize_date,
+    to_object_id
 )
 from app.core.auth import verify_token
-from app.utils.email_sender import send_email
+from app.core.user_directory import user_directory
+from app.core.category_names import category_names
+from app.utils.email_sender import email_queue
+from app.utils.csv_stream import iter_batches, stream_csv, csv_response
+from app.utils.importers import parse_jsonl, parse_csv, parse_ofx
+from app.utils.arrow_export import stream_arrow, stream_parquet, columnar_response
+from app.utils.fast_json import FastJSONResponse
 
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
+logger = logging.getLogger(__name__)
 
-# GET todas las transacciones
+# Helpers
+def parse_date(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', ''))
 
+def is_date_only(value: str) -> bool:
+    return len(value) == 10  # YYYY-MM-DD (input type="date")
 
-@router.get("/", response_model=List[TransactionOut])
-async def list_transactions(decoded=Depends(verify_token)):
-    transactions = await get_transactions(decoded)
+def build_transaction_filters(
+    user_id: Optional[int] = None,
+    category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+) -> dict:
+    filters = {}
+    if user_id is not None:
+        filters["user_id"] = user_id
+    if category_id:
+        filters["category_id"] = to_object_id(category_id, "category_id")
+    if start_date or end_date:
+        filters["date"] = {}
+        if start_date:
+            filters["date"]["$gte"] = parse_date(start_date)
+        if end_date and is_date_only(end_date):
+            # Solo fecha: el día final entra completo
+            filters["date"]["$lt"] = parse_date(end_date) + timedelta(days=1)
+        elif end_date:
+            filters["date"]["$lte"] = parse_date(end_date)
+    if min_amount is not None or max_amount is not None:
+        filters["amount"] = {}
+        if min_amount is not None:
+            filters["amount"]["$gte"] = min_amount
+        if max_amount is not None:
+            filters["amount"]["$lte"] = max_amount
+    return filters
+
+TEXT_FILTER_PATTERNS = {
+    "contains": "{}",
+    "startsWith": "^{}",
+    "endsWith": "{}$",
+    "equals": "^{}$",
+}
+
+def build_text_filters(**fields) -> dict:
+    """Filtros de texto de la tabla de transacciones: {campo: (valor, modo)}.
+
+    Mismo criterio que el filtro del frontend: sin distinguir mayúsculas y con
+    el valor escapado. username y category_name son los desnormalizados en cada
+    transacción; una descripción vacía no se filtra (como en la tabla).
+    """
+    clauses = []
+    for field, (value, mode) in fields.items():
+        if not value:
+            continue
+        if mode not in TEXT_FILTER_PATTERNS:
+            raise HTTPException(status_code=400, detail=f"{field}_mode inválido")
+        regex = {"$regex": TEXT_FILTER_PATTERNS[mode].format(re.escape(value)), "$options": "i"}
+        if field == "description":
+            clauses.append({"$or": [{field: regex}, {field: {"$in": [None, ""]}}]})
+        else:
+            clauses.append({field: regex})
+    return {"$and": clauses} if clauses else {}
+
+CSV_HEADER = ["Usuario", "Categoría", "Monto", "Fecha", "Descripción"]
+
+async def fill_missing_names(transactions: list, decoded: dict):
+    """Completa username/category_name en los documentos que no los tienen.
+
+    Los nombres vienen desnormalizados en cada transacción; solo los documentos
+    anteriores a eso (o con un nombre que no se pudo resolver) pasan por el
+    directorio de usuarios y la caché de categorías.
+    """
+    user_ids = {tx["user_id"] for tx in transactions if tx.get("username") is None}
+    category_ids = {tx["category_id"] for tx in transactions if tx.get("category_name") is None}
+    user_map = await user_directory.get_usernames(user_ids) if user_ids else {}
+    category_map = await category_names.get_names(category_ids, decoded) if category_ids else {}
+    for tx in transactions:
+        if tx.get("username") is None:
+            tx["username"] = user_map.get(str(tx["user_id"]), "Unknown")
+        if tx.get("category_name") is None:
+            tx["category_name"] = category_map.get(str(tx["category_id"]), "Unknown")
+    return len(user_ids), len(category_ids)
+
+async def transaction_csv_rows(cursor, decoded: dict):
+    async for batch in iter_batches(cursor):
+        await fill_missing_names(batch, decoded)
+        yield [
+            [
+                tx["username"],
+                tx["category_name"],
+                tx["amount"],
+                tx["date"],
+                tx.get("description") or ""
+            ]
+            for tx in batch
+        ]
+
+def transaction_row(tx: dict) -> dict:
+    # Fila de TransactionOut sin validar: date se queda como datetime (FastJSONResponse)
+    return {
+        "id": str(tx["_id"]),
+        "user_id": tx["user_id"],
+        "category_id": str(tx["category_id"]),
+        "username": tx["username"],
+        "category_name": tx["category_name"],
+        "amount": tx["amount"],
+        "description": tx.get("description"),
+        "date": tx["date"]
+    }
 
-    # Obtener datos de Postgres y Mongo
-    pg_users = await get_users_from_postgres()
-    categories = await get_categories(decoded)
+# GET transacciones (paginación por cursor sobre (date, _id))
+# El cursor de la página siguiente se devuelve en la cabecera X-Next-Cursor.
+# X-Change-Token permite seguir con /transactions/changes: el cliente debe
+# guardar el de la primera página.
+@router.get("/", response_model=List[TransactionOut], response_class=FastJSONResponse)
+async def list_transactions(
+    decoded=Depends(verify_token),
+    limit: int = Query(1000, ge=1, le=5000),
+    after: Optional[str] = None,
+    user_id: Optional[int] = None,
+    category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    filters = build_transaction_filters(
+        user_id, category_id, start_date, end_date, min_amount, max_amount
+    )
+    change_token = initial_change_token()
+    transactions, next_cursor = await get_transactions(decoded, filters, limit, after)
 
-    print(f"Usuarios de Postgres: {pg_users}")
+    # Nombres desnormalizados; solo los documentos antiguos van a Postgres / categories
+    resolved_users, resolved_categories = await fill_missing_names(transactions, decoded)
 
-    # Crear mapeos
-    user_map = {str(user['id']): user['username']
-                for user in pg_users}  # ← ID como string
-    category_map = {str(cat['_id']): cat['name'] for cat in categories}
+    logger.debug("Listado de transacciones", extra={
+        "rows": len(transactions), "resolved_users": resolved_users, "resolved_categories": resolved_categories
+    })
 
-    print(f"User map: {user_map}")
+    # Datos internos ya tipados: se serializan sin revalidar (ver FastJSONResponse)
+    return FastJSONResponse(
+        [transaction_row(tx) for tx in transactions],
+        headers={"X-Change-Token": change_token, **({"X-Next-Cursor": next_cursor} if next_cursor else {})}
+    )
 
-    return [
-        {
-            "id": str(tx["_id"]),
-            "user_id": tx["user_id"],
-            "category_id": str(tx["category_id"]),
-            "username": user_map.get(str(tx["user_id"]), "Unknown"),
-            "category_name": category_map.get(str(tx["category_id"]), "Unknown"),
-            "amount": tx["amount"],
-            "description": tx.get("description"),
-            # ← Convertir T en TZ para el manejo de fechas.
-            "date": tx["date"].isoformat() + 'Z'
-        }
-        for tx in transactions
-    ]
+# GET cambios desde un token (altas y modificaciones completas, borrados como ids)
+# Coste proporcional a los cambios, no al histórico. 410 si el token es tan
+# antiguo que las marcas de borrado ya han caducado: hay que volver al listado.
+@router.get("/changes", response_model=TransactionChanges, response_class=FastJSONResponse)
+async def list_transaction_changes(
+    since: str,
+    decoded=Depends(verify_token),
+    limit: int = Query(1000, ge=1, le=5000),
+    user_id: Optional[int] = None
+):
+    changed, deleted, next_token, has_more = await get_transaction_changes(decoded, since, limit, user_id)
+    await fill_missing_names(changed, decoded)
+    return FastJSONResponse({
+        "changed": [transaction_row(tx) for tx in changed],
+        "deleted": deleted,
+        "next_token": next_token,
+        "has_more": has_more,
+    })
 
 # POST crear transacción
 @router.post("/", response_model=TransactionOut)
@@ -65,13 +212,108 @@ async def create_new_transaction(transaction: TransactionCreate, decoded=Depends
     return {
         "id": str(new_tx["_id"]),
         "user_id": new_tx["user_id"],
-        "category_id": new_tx["category_id"],
+        "category_id": str(new_tx["category_id"]),
+        "username": new_tx.get("username"),
+        "category_name": new_tx.get("category_name"),
         "amount": new_tx["amount"],
         "description": new_tx.get("description"),
         # ← Convertir T en TZ para el manejo de fechas.
         "date": new_tx["date"].isoformat() + 'Z'
     }
 
+# POST importación masiva (JSON lines, CSV u OFX en el body)
+BULK_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+BULK_CONTENT_TYPES = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json": "jsonl",
+    "text/csv": "csv",
+    "application/x-ofx": "ofx",
+    "application/ofx": "ofx",
+}
+
+@router.post("/bulk", response_model=BulkImportResult)
+async def bulk_import_transactions(
+    request: Request,
+    decoded=Depends(verify_token),
+    format: Optional[str] = Query(None, pattern="^(jsonl|csv|ofx)$"),
+    category_id: Optional[str] = None
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = format or BULK_CONTENT_TYPES.get(content_type)
+    if fmt == "jsonl":
+        rows = parse_jsonl(request.stream())
+    elif fmt == "csv":
+        rows = parse_csv(request.stream())
+    elif fmt == "ofx":
+        if not category_id:
+            raise HTTPException(status_code=400, detail="Los ficheros OFX requieren category_id")
+        rows = parse_ofx(request.stream(), category_id)
+    else:
+        raise HTTPException(status_code=415, detail="Formato no soportado (jsonl, csv u ofx)")
+
+    allowed_categories = await get_category_ids(decoded)
+    is_admin = decoded.get("role") == "admin"
+    result = {"inserted": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    pending_docs, pending_rows = [], []
+
+    def report(row: int, error: str):
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"row": row, "error": error})
+        else:
+            result["errors_truncated"] = True
+
+    async def flush():
+        if not pending_docs:
+            return
+        inserted, write_errors = await insert_transactions_bulk(pending_docs, decoded)
+        result["inserted"] += len(inserted)
+        for index, error in write_errors.items():
+            report(pending_rows[index], error)
+        pending_docs.clear()
+        pending_rows.clear()
+
+    async for row, data in rows:
+        if isinstance(data, Exception):
+            report(row, str(data))
+            continue
+        if not isinstance(data, dict):
+            report(row, "Se esperaba un objeto")
+            continue
+
+        data.setdefault("user_id", decoded["userId"])
+        try:
+            tx = TransactionCreate.model_validate(data)
+        except ValidationError as e:
+            report(row, "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+
+        if tx.user_id != decoded["userId"] and not is_admin:
+            report(row, "Solo administradores pueden crear transacciones para otros usuarios")
+            continue
+        if not ObjectId.is_valid(tx.category_id) or ObjectId(tx.category_id) not in allowed_categories:
+            report(row, "Categoría no encontrada o sin permisos")
+            continue
+
+        pending_docs.append({
+            "user_id": tx.user_id,
+            "category_id": ObjectId(tx.category_id),
+            "amount": tx.amount,
+            "description": tx.description,
+            "date": normalize_date(tx.date),
+        })
+        pending_rows.append(row)
+        if len(pending_docs) >= BULK_CHUNK_SIZE:
+            await flush()
+
+    await flush()
+    return result
+
 # PUT actualizar transacción
 
 
@@ -87,7 +329,9 @@ async def update_existing_transaction(tx_id: str, transaction: TransactionCreate
     return {
         "id": str(updated["_id"]),
         "user_id": updated["user_id"],
-        "category_id": updated["category_id"],
+        "category_id": str(updated["category_id"]),
+        "username": updated.get("username"),
+        "category_name": updated.get("category_name"),
         "amount": updated["amount"],
         "description": updated.get("description"),
         # ← Convertir T en TZ para el manejo de fechas.
@@ -110,86 +354,145 @@ async def export_transactions_csv(
     user_id: Optional[int] = None,
     category_id: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    gzip: bool = False
 ):
+    filters = build_transaction_filters(
+        user_id, category_id, start_date, end_date, min_amount, max_amount
+    )
 
-    # Construir filtros
-    filters = {}
-    if user_id is not None:
-        filters["user_id"] = user_id
-    if category_id:
-        filters["category_id"] = category_id
-    if start_date:
-        filters["date"] = {"$gte": datetime.fromisoformat(
-            start_date.replace('Z', ''))}
-    if end_date:
-        if "date" in filters:
-            filters["date"]["$lte"] = datetime.fromisoformat(
-                end_date.replace('Z', ''))
-        else:
-            filters["date"] = {"$lte": datetime.fromisoformat(
-                end_date.replace('Z', ''))}
-
-    # Usar la nueva función filtrada
-    transactions = await get_transactions_filtered(decoded, filters)
+    cursor = find_transactions_filtered(decoded, filters)
 
-    # Obtener datos de Postgres y Mongo
-    pg_users = await get_users_from_postgres()
-    categories = await get_categories(decoded)
+    filename = f"finanzas_transacciones_{datetime.now().strftime('%Y%m%d')}.csv"
+    return csv_response(
+        stream_csv(CSV_HEADER, transaction_csv_rows(cursor, decoded), gzip),
+        filename,
+        gzip
+    )
 
-    # Crear mapeos
-    user_map = {str(user['id']): user['username'] for user in pg_users}
-    category_map = {str(cat['_id']): cat['name'] for cat in categories}
+# Export columnar (Parquet / Arrow IPC) con los mismos filtros que /export/csv
+COLUMNAR_BATCH_SIZE = 10000
+
+async def transaction_columnar_rows(cursor, decoded: dict):
+    async for batch in iter_batches(cursor, COLUMNAR_BATCH_SIZE):
+        await fill_missing_names(batch, decoded)
+        yield [
+            {
+                "user_id": tx["user_id"],
+                "username": tx["username"],
+                "category_id": str(tx["category_id"]),
+                "category_name": tx["category_name"],
+                "amount": tx["amount"],
+                "date": tx["date"],
+                "description": tx.get("description"),
+            }
+            for tx in batch
+        ]
+
+@router.get("/export/parquet")
+async def export_transactions_parquet(
+    decoded=Depends(verify_token),
+    user_id: Optional[int] = None,
+    category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    filters = build_transaction_filters(
+        user_id, category_id, start_date, end_date, min_amount, max_amount
+    )
+    cursor = find_transactions_filtered(decoded, filters, COLUMNAR_BATCH_SIZE)
 
-    csv_data = "Usuario,Categoría,Monto,Fecha,Descripción\n"
-    for tx in transactions:
-        username = user_map.get(str(tx["user_id"]), "Unknown")
-        category_name = category_map.get(str(tx["category_id"]), "Unknown")
+    filename = f"finanzas_transacciones_{datetime.now().strftime('%Y%m%d')}.parquet"
+    return columnar_response(
+        stream_parquet(transaction_columnar_rows(cursor, decoded)),
+        filename,
+        "application/vnd.apache.parquet"
+    )
 
-        csv_data += f'"{username}","{category_name}",{tx["amount"]},{tx["date"]},"{tx.get("description", "")}"\n'
+@router.get("/export/arrow")
+async def export_transactions_arrow(
+    decoded=Depends(verify_token),
+    user_id: Optional[int] = None,
+    category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    filters = build_transaction_filters(
+        user_id, category_id, start_date, end_date, min_amount, max_amount
+    )
+    cursor = find_transactions_filtered(decoded, filters, COLUMNAR_BATCH_SIZE)
 
-    filename = f"finanzas_transacciones_{datetime.now().strftime('%Y%m%d')}.csv"
-    return Response(
-        content=csv_data,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    filename = f"finanzas_transacciones_{datetime.now().strftime('%Y%m%d')}.arrows"
+    return columnar_response(
+        stream_arrow(transaction_columnar_rows(cursor, decoded)),
+        filename,
+        "application/vnd.apache.arrow.stream"
     )
 
-@router.post("/export/email")
-async def export_transactions_email(request: dict, decoded=Depends(verify_token)):
+# El informe se genera en el servidor con los mismos filtros que /export/csv
+@router.post("/export/email", status_code=202)
+async def export_transactions_email(
+    decoded=Depends(verify_token),
+    user_id: Optional[int] = None,
+    category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    username: Optional[str] = None,
+    username_mode: str = "contains",
+    category_name: Optional[str] = None,
+    category_name_mode: str = "contains",
+    description: Optional[str] = None,
+    description_mode: str = "contains"
+):
     try:
-        csv_data = request.get("csv_data", "")
-        total = request.get("total_transactions", 0)
-        summary_data = request.get("summary_data", [])
-
-# Generar filas de resumen - TRANSACCIONES INDIVIDUALES
-        summary_rows = ""
-        if summary_data:
-            max_summary_rows = 20
-            display_transactions = summary_data[:min(max_summary_rows, len(summary_data))]
-
-            for tx in display_transactions:
-                # Formatear fecha
-                tx_date = tx.get('fecha', '')
-                if isinstance(tx_date, str) and 'T' in tx_date:
-                    tx_date = tx_date.split('T')[0]  # Solo la parte de la fecha
-                
-                summary_rows += f"""
+        filters = build_transaction_filters(
+            user_id, category_id, start_date, end_date, min_amount, max_amount
+        )
+        # Filtros de texto de la tabla: el informe contiene las mismas filas que se ven
+        filters.update(build_text_filters(
+            username=(username, username_mode),
+            category_name=(category_name, category_name_mode),
+            description=(description, description_mode),
+        ))
+        max_summary_rows = 20
+
+        # Resumen (primeras 20) y totales en una sola agregación
+        top, total, total_amount = await get_transactions_summary(decoded, filters, max_summary_rows)
+
+        await fill_missing_names(top, decoded)
+
+        # CSV adjunto generado desde el cursor
+        chunks = stream_csv(CSV_HEADER, transaction_csv_rows(find_transactions_filtered(decoded, filters), decoded))
+        csv_data = b"".join([chunk async for chunk in chunks])
+
+        # Generar filas de resumen - TRANSACCIONES INDIVIDUALES
+        summary_rows = "".join(
+            f"""
                 <tr style="border-bottom: 1px solid #ddd;">
-                    <td style="padding: 8px;">{tx['username']}</td>
-                    <td style="padding: 8px;">{tx['category_name']}</td>
-                    <td style="padding: 8px; text-align: right;">{tx['cantidad']:.2f} €</td>
-                    <td style="padding: 8px;">{tx.get('description', '')}</td>
-                    <td style="padding: 8px;">{tx_date}</td>
+                    <td style="padding: 8px;">{escape(tx["username"])}</td>
+                    <td style="padding: 8px;">{escape(tx["category_name"])}</td>
+                    <td style="padding: 8px; text-align: right;">{tx['amount']:.2f} €</td>
+                    <td style="padding: 8px;">{escape(tx.get('description') or '')}</td>
+                    <td style="padding: 8px;">{tx['date'].strftime('%Y-%m-%d')}</td>
                 </tr>
                 """
-            
-            # Mensaje si hay más de 20 transacciones
-            if len(summary_data) > max_summary_rows:
-                summary_rows += f"""
+            for tx in top
+        )
+
+        # Mensaje si hay más de 20 transacciones
+        if total > max_summary_rows:
+            summary_rows += f"""
                 <tr>
                     <td colspan="5" style="padding: 8px; text-align: center; font-style: italic;">
-                        ... y {len(summary_data) - max_summary_rows} transacciones más (ver CSV adjunto)
+                        ... y {total - max_summary_rows} transacciones más (ver CSV adjunto)
                     </td>
                 </tr>
                 """
@@ -201,6 +504,7 @@ async def export_transactions_email(request: dict, decoded=Depends(verify_token)
             </h2>
             <p><strong>Generado:</strong> {datetime.now().strftime('%d/%m/%Y %H:%M')}</p>
             <p><strong>Total de transacciones:</strong> {total}</p>
+            <p><strong>Importe total:</strong> {total_amount:.2f} €</p>
             
             <h3 style="color: #4F81BD;">Resumen</h3>
             <table style="width: 100%; border-collapse: collapse; margin-top: 15px;">
@@ -224,9 +528,11 @@ async def export_transactions_email(request: dict, decoded=Depends(verify_token)
         </div>
         """
 
-        await send_email(decoded["email"], "Reporte de Transacciones Finanzas", html_body, csv_data)
-        return {"status": "success", "message": f"Email enviado a {decoded['email']}"}
+        job_id = await email_queue.enqueue(decoded["email"], "Reporte de Transacciones Finanzas", html_body, csv_data)
+        return {"status": "queued", "job_id": job_id, "message": f"Email en cola para {decoded['email']}"}
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error completo: {repr(e)}")
+        logger.exception("Error generando reporte por email")
         raise HTTPException(status_code=500, detail=f"Error generando reporte: {str(e)}")
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Annotated, Literal, Optional
 from datetime import datetime
 
 # Usuario
@@ -44,6 +44,44 @@ class TransactionOut(BaseModel):
     description: Optional[str] = None
     date: datetime
 
+# Sincronización incremental (GET /transactions/changes)
+class TransactionChanges(BaseModel):
+    changed: list[TransactionOut]
+    deleted: list[str]
+    next_token: str
+    has_more: bool
+
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: list[BulkImportError]
+    errors_truncated: bool = False
+
+
+# Presupuestos
+class BudgetCreate(BaseModel):
+    category_id: str
+    period: Literal["week", "month", "year"] = "month"
+    limit: float = Field(gt=0)
+    # Fracciones del límite que generan aviso (0.8 = 80 %); un umbral <= 0
+    # avisaría en cuanto empieza el periodo, sin gasto
+    thresholds: list[Annotated[float, Field(gt=0)]] = Field(default=[0.8, 1.0], min_length=1, max_length=10)
+
+class BudgetOut(BaseModel):
+    id: str
+    category_id: str
+    category_name: Optional[str] = None
+    period: str
+    limit: float
+    thresholds: list[float]
+    period_start: datetime
+    spent: float
+    remaining: float
+
 
 # Estadísticas
 class StatsByUser(BaseModel):
@@ -60,3 +98,31 @@ class StatsOverTime(BaseModel):
     year: int
     month: int
     total: float
+
+# Dashboard: totales y las tres vistas de una sola vez
+class StatsDashboardTotals(BaseModel):
+    count: int
+    income: float
+    expense: float  # en positivo
+    net: float
+
+class StatsDashboard(BaseModel):
+    totals: StatsDashboardTotals
+    by_user: list[StatsByUser]
+    by_category: list[StatsByCategory]
+    over_time: list[StatsOverTime]
+
+# Serie temporal en formato columnar (timestamps en epoch ms)
+class StatsTimeSeriesCategory(BaseModel):
+    category_id: str
+    category_name: str
+    values: list[float]
+    cumulative: list[float]
+
+class StatsTimeSeries(BaseModel):
+    granularity: str
+    timezone: str
+    timestamps: list[int]
+    values: Optional[list[float]] = None
+    cumulative: Optional[list[float]] = None
+    series: Optional[list[StatsTimeSeriesCategory]] = None
@@ -0,0 +1,94 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import StreamingResponse
+
+# Export columnar de transacciones (Parquet y Arrow IPC stream).
+# Los lotes del cursor se convierten en RecordBatch tipados y se envían según
+# se escriben, así que la memoria depende del tamaño de lote, no del total.
+
+TRANSACTION_SCHEMA = pa.schema([
+    ("user_id", pa.int64()),
+    ("username", pa.dictionary(pa.int32(), pa.string())),
+    ("category_id", pa.dictionary(pa.int32(), pa.string())),
+    ("category_name", pa.dictionary(pa.int32(), pa.string())),
+    ("amount", pa.float64()),
+    ("date", pa.timestamp("ms", tz="UTC")),
+    ("description", pa.string()),
+])
+
+
+class ChunkSink:
+    """Fichero de solo escritura que acumula bytes hasta que se recogen con drain()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def to_record_batch(rows: list) -> pa.RecordBatch:
+    """rows: dicts con user_id, username, category_id, category_name, amount, date, description."""
+    columns = {name: [row[name] for row in rows] for name in TRANSACTION_SCHEMA.names}
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(columns[field.name], type=field.type.value_type).dictionary_encode()
+            if pa.types.is_dictionary(field.type)
+            else pa.array(columns[field.name], type=field.type)
+            for field in TRANSACTION_SCHEMA
+        ],
+        schema=TRANSACTION_SCHEMA,
+    )
+
+
+async def stream_arrow(row_batches):
+    sink = ChunkSink()
+    writer = pa.ipc.new_stream(sink, TRANSACTION_SCHEMA)
+    async for rows in row_batches:
+        writer.write_batch(to_record_batch(rows))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def stream_parquet(row_batches, compression: str = "zstd"):
+    sink = ChunkSink()
+    # Cada lote es un row group; el footer se escribe al cerrar
+    writer = pq.ParquetWriter(sink, TRANSACTION_SCHEMA, compression=compression)
+    async for rows in row_batches:
+        writer.write_batch(to_record_batch(rows))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def columnar_response(chunks, filename: str, media_type: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -0,0 +1,39 @@
+import logging
+from html import escape
+from fastapi import HTTPException
+from app.utils.email_sender import email_queue
+
+logger = logging.getLogger(__name__)
+
+PERIOD_LABELS = {"week": "semana", "month": "mes", "year": "año"}
+
+
+async def notify_budget_alert(budget: dict, period_start, spent: float, threshold: float):
+    """Avisa por email de que un presupuesto ha cruzado un umbral.
+
+    No bloquea la escritura que lo provoca: el email se encola y lo envían los
+    workers de email_queue. Si la cola está llena el aviso se pierde (queda en el log).
+    """
+    limit = budget["limit"]
+    percent = round(threshold * 100)
+    logger.info("Umbral de presupuesto superado", extra={
+        "budget_id": str(budget["_id"]), "user_id": budget["user_id"],
+        "threshold": threshold, "spent": spent, "limit": limit,
+    })
+    if not budget.get("email"):
+        return
+
+    name = budget.get("category_name") or "tu categoría"
+    period = PERIOD_LABELS.get(budget["period"], budget["period"])
+    html_body = f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px;">
+            <h2 style="color: #c0392b;">Presupuesto al {percent}%</h2>
+            <p>Has gastado <strong>{spent:.2f} €</strong> de <strong>{limit:.2f} €</strong>
+               en <strong>{escape(name)}</strong> este {period} (desde {period_start.strftime('%Y-%m-%d')}).</p>
+        </div>
+        """
+    try:
+        await email_queue.enqueue(budget["email"], f"Presupuesto de {name} al {percent}%", html_body)
+    except HTTPException:
+        logger.warning("Cola de emails llena: aviso de presupuesto descartado",
+                       extra={"budget_id": str(budget["_id"])})
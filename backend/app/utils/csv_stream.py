@@ -0,0 +1,56 @@
+import csv
+import io
+import zlib
+from fastapi.responses import StreamingResponse
+
+
+async def iter_batches(cursor, batch_size: int = 500):
+    """Agrupa los documentos de un cursor de Motor en listas de batch_size."""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_csv(header: list, row_batches, compress: bool = False):
+    """Genera el CSV por trozos a partir de lotes de filas.
+
+    Cada lote se escribe con csv.writer sobre un único buffer que se vacía
+    tras cada envío, así la memoria no depende del número de filas.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 -> formato gzip
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(header)
+    yield flush()
+
+    async for rows in row_batches:
+        writer.writerows(rows)
+        chunk = flush()
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+def csv_response(chunks, filename: str, compress: bool = False) -> StreamingResponse:
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if compress else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
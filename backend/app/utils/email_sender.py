@@ -1,30 +1,178 @@
+import asyncio
+import logging
 import smtplib
+import uuid
+from datetime import datetime, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-import os
 from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+from app.config import settings
+from app.db import get_db
 
-async def send_email(to_email: str, subject: str, html_body: str, csv_data: str = None):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = f'"Finanzas App" <{os.getenv("EMAIL_USER")}>'
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Adjuntar HTML body
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        # Adjuntar CSV si se proporciona
-        if csv_data:
-            attachment = MIMEApplication(csv_data, _subtype="csv")
-            attachment.add_header('Content-Disposition', 'attachment', filename='transacciones.csv')
-            msg.attach(attachment)
-        
-        # Enviar email
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASS"))
-            server.send_message(msg)
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error enviando email: {str(e)}")
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+
+def build_message(to_email: str, subject: str, html_body: str, csv_data: str = None,
+                  filename: str = "transacciones.csv") -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = f'"Finanzas App" <{settings.EMAIL_USER}>'
+    msg['To'] = to_email
+    msg['Subject'] = subject
+
+    # Adjuntar HTML body
+    msg.attach(MIMEText(html_body, 'html'))
+
+    # Adjuntar CSV si se proporciona
+    if csv_data:
+        attachment = MIMEApplication(csv_data, _subtype="csv")
+        attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+        msg.attach(attachment)
+    return msg
+
+
+class SMTPConnection:
+    """Conexión SMTP autenticada y reutilizable (una por worker).
+
+    smtplib es bloqueante, así que todas las llamadas se hacen en un hilo
+    con asyncio.to_thread para no parar el event loop.
+    """
+
+    def __init__(self):
+        self.server = None
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if settings.EMAIL_USE_SSL else smtplib.SMTP
+        server = smtp_class(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT)
+        if settings.EMAIL_USER and settings.EMAIL_PASS:
+            server.login(settings.EMAIL_USER, settings.EMAIL_PASS)
+        return server
+
+    def _send(self, msg):
+        if self.server is not None:
+            try:
+                self.server.noop()
+            except (smtplib.SMTPException, OSError):
+                self.server = None
+        if self.server is None:
+            self.server = self._connect()
+        self.server.send_message(msg)
+
+    def _close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    async def send(self, msg):
+        try:
+            await asyncio.to_thread(self._send, msg)
+        except Exception:
+            # Descartar la conexión: el reintento abrirá una nueva
+            await self.close()
+            raise
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+
+def email_jobs_collection():
+    # Estado de cada envío; el índice TTL de created_at los borra (EMAIL_JOB_TTL_DAYS)
+    return get_db()["email_jobs"]
+
+
+class EmailQueue:
+    """Cola acotada de emails salientes con un pool de workers.
+
+    enqueue() devuelve un job id al momento; los workers envían en segundo
+    plano reutilizando su conexión SMTP y reintentan con backoff exponencial.
+    La cola es de cada worker de uvicorn, pero el estado de los envíos se
+    guarda en MongoDB (email_jobs), así que cualquier worker puede consultarlo.
+    Si el proceso se para con envíos pendientes, esos se pierden y su estado
+    se queda en "queued".
+    """
+
+    def __init__(self, max_size: int = 100, workers: int = 2, max_retries: int = 3,
+                 backoff: float = 1.0):
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, to_email: str, subject: str, html_body: str, csv_data: str = None,
+                      filename: str = "transacciones.csv") -> str:
+        if self.queue.full():
+            raise HTTPException(status_code=503, detail="Cola de emails llena, inténtalo más tarde")
+        job_id = uuid.uuid4().hex
+        msg = build_message(to_email, subject, html_body, csv_data, filename)
+        # El estado se guarda antes de encolar: el worker solo lo actualiza
+        await email_jobs_collection().insert_one({
+            "_id": job_id, "to": to_email, "status": "queued", "attempts": 0,
+            "created_at": datetime.now(timezone.utc),
+        })
+        try:
+            self.queue.put_nowait((job_id, msg))
+        except asyncio.QueueFull:
+            await email_jobs_collection().delete_one({"_id": job_id})
+            raise HTTPException(status_code=503, detail="Cola de emails llena, inténtalo más tarde")
+        return job_id
+
+    async def status(self, job_id: str):
+        return await email_jobs_collection().find_one({"_id": job_id})
+
+    async def _set_status(self, job_id: str, status: dict):
+        try:
+            await email_jobs_collection().update_one({"_id": job_id}, {"$set": status})
+        except PyMongoError as e:
+            # El envío no depende de poder guardar su estado
+            logger.warning("No se pudo guardar el estado del email", extra={"job_id": job_id, "error": str(e)})
+
+    async def _worker(self):
+        connection = SMTPConnection()
+        try:
+            while True:
+                job_id, msg = await self.queue.get()
+                try:
+                    await self._deliver(connection, job_id, msg)
+                finally:
+                    self.queue.task_done()
+        finally:
+            await connection.close()
+
+    async def _deliver(self, connection: SMTPConnection, job_id: str, msg):
+        job = {"status": "queued", "attempts": 0, "error": None}
+        for attempt in range(1, self.max_retries + 1):
+            job["attempts"] = attempt
+            try:
+                await connection.send(msg)
+                job["status"] = "sent"
+                job["error"] = None
+                break
+            except Exception as e:
+                job["error"] = str(e)
+                if attempt == self.max_retries:
+                    job["status"] = "failed"
+                    logger.error("Error enviando email", extra={"job_id": job_id, "attempts": attempt, "error": str(e)})
+                else:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+        await self._set_status(job_id, job)
+
+
+email_queue = EmailQueue(
+    max_size=settings.EMAIL_QUEUE_SIZE,
+    workers=settings.EMAIL_WORKERS,
+    max_retries=settings.EMAIL_MAX_RETRIES,
+)
@@ -0,0 +1,24 @@
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+
+# Respuesta JSON rápida para listados grandes construidos con datos internos.
+# Las rutas la devuelven directamente: FastAPI no revalida cada fila contra
+# response_model (que se mantiene solo para la documentación OpenAPI) ni pasa
+# el contenido por jsonable_encoder. orjson serializa los datetime de forma
+# nativa; los naive se tratan como UTC y se escriben con sufijo Z.
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z,
+        )
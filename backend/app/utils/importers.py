@@ -0,0 +1,158 @@
+import codecs
+import csv
+import json
+import re
+from collections import deque
+from datetime import datetime
+
+# Parsers en streaming para la importación masiva de transacciones.
+# Todos reciben el iterador asíncrono de bytes del body (request.stream())
+# y generan tuplas (número_de_fila, dict | Exception) sin cargar el fichero entero.
+
+
+async def iter_lines(byte_chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in byte_chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def parse_jsonl(byte_chunks):
+    row = 0
+    async for line in iter_lines(byte_chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row, e
+
+
+class LineFeed:
+    """Iterador de líneas para csv.reader al que se le van añadiendo más."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def iter_csv_records(byte_chunks):
+    """Registros CSV del stream con un único csv.reader.
+
+    Un campo entre comillas puede contener saltos de línea (descripciones de
+    los bancos): las líneas se acumulan hasta que las comillas quedan
+    cerradas (número par; "" escapa una comilla) y solo entonces el reader
+    lee el registro completo.
+    """
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    record = []
+    quotes = 0
+    async for line in iter_lines(byte_chunks):
+        if not record and not line.strip():
+            continue
+        record.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            feed.lines.extend(record)
+            yield next(reader)
+            record, quotes = [], 0
+    if record:
+        # Comillas sin cerrar al final del fichero: el reader lee lo que haya
+        feed.lines.extend(record)
+        yield next(reader)
+
+
+async def parse_csv(byte_chunks):
+    """CSV con cabecera: user_id (opcional), category_id, amount, description, date."""
+    header = None
+    row = 0
+    async for values in iter_csv_records(byte_chunks):
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, ValueError(f"Se esperaban {len(header)} columnas y hay {len(values)}")
+            continue
+        yield row, {k: v for k, v in zip(header, values) if v != "" or k == "description"}
+
+
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+OFX_DATE_FORMATS = {14: "%Y%m%d%H%M%S", 12: "%Y%m%d%H%M", 8: "%Y%m%d"}
+
+
+def parse_ofx_date(value: str) -> datetime:
+    # YYYYMMDD[HHMM[SS[.XXX]]][[+-]TZ:NOMBRE]
+    digits = re.match(r"\d*", value.strip()).group()[:14]
+    if len(digits) not in OFX_DATE_FORMATS:
+        raise ValueError(f"Fecha OFX no válida: {value!r}")
+    return datetime.strptime(digits, OFX_DATE_FORMATS[len(digits)])
+
+
+async def parse_ofx(byte_chunks, category_id: str):
+    """Extrae los <STMTTRN> de un extracto OFX (SGML 1.x o XML 2.x).
+
+    OFX no trae categoría, así que todas las filas usan category_id.
+    """
+    decoder = codecs.getincrementaldecoder("latin-1")()
+    buffer = ""
+    current = None
+    row = 0
+
+    chunks = byte_chunks.__aiter__()
+    finished = False
+    while not finished:
+        try:
+            chunk = await chunks.__anext__()
+            buffer += decoder.decode(chunk)
+        except StopAsyncIteration:
+            buffer += decoder.decode(b"", final=True)
+            finished = True
+
+        # Procesar solo hasta el último '<' completo; el resto espera al siguiente trozo
+        cut = len(buffer) if finished else buffer.rfind("<")
+        if cut <= 0:
+            continue
+        text, buffer = buffer[:cut], buffer[cut:]
+
+        for closing, tag, value in OFX_TAG.findall(text):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if not closing:
+                    current = {}
+                    continue
+                if current is not None:
+                    row += 1
+                    try:
+                        description = " ".join(
+                            v for v in (current.get("NAME"), current.get("MEMO")) if v
+                        )
+                        yield row, {
+                            "category_id": category_id,
+                            "amount": float(current["TRNAMT"]),
+                            "description": description or None,
+                            "date": parse_ofx_date(current["DTPOSTED"]),
+                        }
+                    except (KeyError, ValueError) as e:
+                        yield row, ValueError(f"STMTTRN incompleto: {e}")
+                    current = None
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
@@ -0,0 +1,134 @@
+# Bloqueo del event loop al enviar emails: envío inline con smtplib (como el
+# send_email original) frente a email_queue (workers + asyncio.to_thread).
+# Un servidor aiosmtpd local hace de Gmail; --server-delay simula la latencia
+# de cada envío (TLS, login, DATA). Mientras se envía, un "ticker" se despierta
+# cada --tick-ms y mide cuánto llega tarde: eso es lo que esperan las demás
+# peticiones de la API.
+#
+# El estado de los envíos (email_jobs en MongoDB) no se guarda: no forma parte
+# de lo que se mide y así el benchmark no necesita MongoDB.
+#
+# Uso (desde backend/): python -m bench.bench_email [--emails 20] [--server-delay 0.1]
+import argparse
+import asyncio
+import json
+import smtplib
+import statistics
+import time
+import uuid
+
+from aiosmtpd.controller import Controller
+
+from app.config import settings
+from app.utils.email_sender import EmailQueue, build_message
+
+
+class SlowHandler:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        return "250 OK"
+
+
+class BenchQueue(EmailQueue):
+    async def _set_status(self, job_id: str, status: dict):
+        pass
+
+
+def send_inline(msg):
+    # Camino anterior: conexión nueva y envío bloqueante dentro de la petición
+    with smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT) as server:
+        server.send_message(msg)
+
+
+async def measure(send_all, tick_ms: float) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        interval = tick_ms / 1000
+        while not done.is_set():
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lags.append((time.perf_counter() - expected) * 1000)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    caller_ms = await send_all()
+    total = time.perf_counter() - started
+    done.set()
+    await ticker_task
+
+    lags.sort()
+    return {
+        "total_s": round(total, 3),
+        # Lo que tarda en volver la petición que envía (inline) o encola
+        "caller_ms": round(caller_ms, 3),
+        "loop_lag_max_ms": round(lags[-1], 3) if lags else None,
+        "loop_lag_p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 3) if lags else None,
+        "loop_lag_mean_ms": round(statistics.fmean(lags), 3) if lags else None,
+        "ticks": len(lags),
+    }
+
+
+async def main(args):
+    handler = SlowHandler(args.server_delay)
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    settings.EMAIL_HOST, settings.EMAIL_PORT = "127.0.0.1", args.port
+    settings.EMAIL_USE_SSL, settings.EMAIL_USER, settings.EMAIL_PASS = False, "", ""
+
+    messages = [
+        build_message("bench@local", f"Bench {i}", "<p>bench</p>", "a;b\n1;2\n")
+        for i in range(args.emails)
+    ]
+
+    async def inline():
+        started = time.perf_counter()
+        for msg in messages:
+            send_inline(msg)
+        return (time.perf_counter() - started) * 1000 / len(messages)
+
+    queue = BenchQueue(max_size=len(messages), workers=args.workers, max_retries=1)
+
+    async def queued():
+        queue.start()
+        started = time.perf_counter()
+        for msg in messages:
+            queue.queue.put_nowait((uuid.uuid4().hex, msg))
+        caller_ms = (time.perf_counter() - started) * 1000 / len(messages)
+        await queue.queue.join()
+        await queue.stop()
+        return caller_ms
+
+    try:
+        results = {
+            "emails": args.emails,
+            "server_delay_s": args.server_delay,
+            "workers": args.workers,
+            "inline": await measure(inline, args.tick_ms),
+            "queue": await measure(queued, args.tick_ms),
+            "received": handler.received,
+        }
+    finally:
+        controller.stop()
+    print(json.dumps(results, indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bloqueo del event loop: email inline vs email_queue")
+    parser.add_argument("--emails", type=int, default=20)
+    parser.add_argument("--server-delay", type=float, default=0.1, help="latencia simulada por envío (s)")
+    parser.add_argument("--workers", type=int, default=settings.EMAIL_WORKERS)
+    parser.add_argument("--tick-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8025)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
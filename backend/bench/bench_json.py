@@ -0,0 +1,93 @@
+# Micro-benchmark de la serialización de GET /transactions/ con 10k filas (sin Mongo):
+# camino anterior (isoformat por fila + validación contra List[TransactionOut] +
+# jsonable_encoder + JSONResponse) frente a FastJSONResponse con datetime nativos.
+# Uso (desde backend/): python -m bench.bench_json [filas] [repeticiones]
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from app.routes.transactions import transaction_row
+from app.schemas import TransactionOut
+from app.utils.fast_json import FastJSONResponse
+
+
+def make_transactions(rows: int):
+    categories = [ObjectId() for _ in range(20)]
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": 1 + i % 50,
+            "category_id": categories[i % len(categories)],
+            "amount": round(i * 1.37, 2),
+            "description": f"movimiento {i}",
+            "date": start + timedelta(minutes=i, milliseconds=i % 1000),
+        }
+        for i in range(rows)
+    ], {str(c): f"cat{n}" for n, c in enumerate(categories)}
+
+
+def with_names(transactions, user_map, category_map):
+    # Nombres desnormalizados, como los guarda create_transaction
+    for tx in transactions:
+        tx["username"] = user_map[str(tx["user_id"])]
+        tx["category_name"] = category_map[str(tx["category_id"])]
+    return transactions
+
+
+async def legacy(transactions, field):
+    content = [
+        {**transaction_row(tx), "date": tx["date"].isoformat() + 'Z'}
+        for tx in transactions
+    ]
+    content = await serialize_response(field=field, response_content=content)
+    return JSONResponse(content).body
+
+
+async def fast(transactions):
+    return FastJSONResponse([transaction_row(tx) for tx in transactions]).body
+
+
+async def measure(repeat: int, operation):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = await operation()
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+async def main(rows: int, repeat: int):
+    transactions, category_map = make_transactions(rows)
+    transactions = with_names(transactions, {str(i): f"user{i}" for i in range(1, 51)}, category_map)
+    field = create_model_field(name="Response", type_=List[TransactionOut], mode="serialization")
+
+    legacy_s, legacy_body = await measure(repeat, lambda: legacy(transactions, field))
+    fast_s, fast_body = await measure(repeat, lambda: fast(transactions))
+
+    # Ambos caminos deben producir el mismo documento
+    assert json.loads(legacy_body) == json.loads(fast_body)
+
+    print(json.dumps({
+        "rows": rows,
+        "legacy_ms": round(legacy_s * 1000, 2),
+        "fast_ms": round(fast_s * 1000, 2),
+        "legacy_rows_per_s": round(rows / legacy_s),
+        "fast_rows_per_s": round(rows / fast_s),
+        "speedup": round(legacy_s / fast_s, 1),
+        "legacy_bytes": len(legacy_body),
+        "fast_bytes": len(fast_body),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 5,
+    ))
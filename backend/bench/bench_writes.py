@@ -0,0 +1,95 @@
+# Benchmark de las rutas de escritura de crud.py: latencia y comandos Mongo por operación.
+# Usa una base de datos propia (BENCH_DB_NAME, por defecto finanzas_bench) que se borra al terminar.
+# Uso (desde backend/): python -m bench.bench_writes [iteraciones]
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from pymongo import monitoring
+
+os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "finanzas_bench")
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+counter = CommandCounter()
+# Registrar antes de crear el cliente: el listener se aplica a los clientes creados después
+monitoring.register(counter)
+
+from app import crud  # noqa: E402
+from app.db import get_db  # noqa: E402
+
+USER = {"userId": 1, "role": "basic", "email": "bench@example.com"}
+
+
+async def measure(name: str, iterations: int, operation):
+    latencies = []
+    counter.commands.clear()
+    for i in range(iterations):
+        start = time.perf_counter()
+        await operation(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "operation": name,
+        "iterations": iterations,
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "mongo_ops_per_request": round(sum(counter.commands.values()) / iterations, 2),
+        "commands": dict(counter.commands),
+    }
+
+
+async def main(iterations: int):
+    db = get_db()
+    await db.client.drop_database(db.name)
+    category = await crud.create_category({"name": "bench", "description": None}, USER)
+    tx_ids = []
+
+    async def create_tx(i):
+        tx = await crud.create_transaction({
+            "user_id": USER["userId"],
+            "category_id": str(category["_id"]),
+            "amount": float(i),
+            "description": "bench",
+            "date": datetime(2024, 1 + i % 12, 1),
+        }, USER)
+        tx_ids.append(str(tx["_id"]))
+
+    async def update_tx(i):
+        await crud.update_transaction(tx_ids[i], {"amount": float(i) + 0.5}, USER)
+
+    async def create_cat(i):
+        await crud.create_category({"name": f"cat{i}", "description": None}, USER)
+
+    async def update_cat(i):
+        await crud.update_category(str(category["_id"]), {"name": f"bench{i}"}, USER)
+
+    results = [
+        await measure("create_transaction", iterations, create_tx),
+        await measure("update_transaction", iterations, update_tx),
+        await measure("create_category", iterations, create_cat),
+        await measure("update_category", iterations, update_cat),
+    ]
+    await db.client.drop_database(db.name)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,275 @@
+# Pruebas de carga de la API completa: siembra datos y lanza peticiones contra la
+# app real de FastAPI (httpx.AsyncClient + ASGITransport, sin servidor HTTP).
+#
+# - MongoDB: base de datos propia (BENCH_DB_NAME, por defecto finanzas_bench).
+# - Postgres: por defecto se sustituye por usernames precargados en la caché de
+#   user_directory; con --postgres se usa el pool real (POSTGRES_* del .env).
+#
+# Resultados (p50/p95/p99 y throughput por endpoint) en JSON, con el commit
+# actual, para comparar entre commits con --compare.
+#
+# Uso (desde backend/):
+#   python -m bench.load_test --transactions 100000 --users 10 --keep --output bench_100k.json
+#   python -m bench.load_test --transactions 100000 --users 10 --reuse --compare bench_100k.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "finanzas_bench")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+from app import crud  # noqa: E402
+from app.core import auth  # noqa: E402
+from app.core.stats_cache import stats_cache  # noqa: E402
+from app.core.user_directory import user_directory  # noqa: E402
+from app.db import get_db, mongo  # noqa: E402
+from app.indexes import ensure_indexes  # noqa: E402
+from app.main import app  # noqa: E402
+
+SEED_BATCH_SIZE = 10000
+CATEGORIES_PER_USER = 10
+START_DATE = datetime(2023, 1, 1)
+SPAN_DAYS = 730
+
+
+def make_token(user_id: int, role: str = "basic") -> str:
+    return jwt.encode(
+        {
+            "userId": user_id,
+            "role": role,
+            "isApproved": True,
+            "email": f"user{user_id}@bench.local",
+            "exp": int(time.time()) + 24 * 3600,
+        },
+        auth.JWT_SECRET,
+        algorithm=auth.ALGORITHM,
+    )
+
+
+async def seed(transactions: int, users: int, reuse: bool, seed_value: int) -> dict:
+    """Categorías por usuario y transacciones repartidas en dos años. Devuelve {user_id: [category_id]}."""
+    db = get_db()
+    rng = random.Random(seed_value)
+
+    meta = {"transactions": transactions, "users": users, "seed": seed_value}
+    if reuse and await db["bench_meta"].find_one({"_id": "seed", **meta}):
+        category_ids = {}
+        async for cat in db["categories"].find({}, {"user_id": 1}):
+            category_ids.setdefault(cat["user_id"], []).append(cat["_id"])
+        print(f"Reutilizando los datos sembrados en {db.name}", file=sys.stderr)
+        return category_ids
+
+    await db.client.drop_database(db.name)
+    await ensure_indexes(db)
+
+    category_ids = {}
+    for user_id in range(1, users + 1):
+        result = await db["categories"].insert_many([
+            {"name": f"cat{n}", "name_lower": f"cat{n}", "description": "bench", "user_id": user_id}
+            for n in range(CATEGORIES_PER_USER)
+        ])
+        category_ids[user_id] = result.inserted_ids
+
+    started = time.perf_counter()
+    for offset in range(0, transactions, SEED_BATCH_SIZE):
+        batch = []
+        for _ in range(min(SEED_BATCH_SIZE, transactions - offset)):
+            user_id = rng.randint(1, users)
+            date = START_DATE + timedelta(seconds=rng.randrange(SPAN_DAYS * 86400))
+            category = rng.randrange(CATEGORIES_PER_USER)
+            batch.append({
+                "user_id": user_id,
+                "username": f"user{user_id}",
+                "category_id": category_ids[user_id][category],
+                "category_name": f"cat{category}",
+                "amount": round(rng.uniform(-500, 500), 2),
+                "description": "bench",
+                "date": date,
+            })
+        await db["transactions"].insert_many(batch, ordered=False)
+    await crud.rebuild_rollups()
+    await db["bench_meta"].replace_one({"_id": "seed"}, meta, upsert=True)
+    print(f"Sembradas {transactions} transacciones en {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return category_ids
+
+
+def preload_usernames(users: int):
+    # Sustituto de Postgres: todos los usernames en caché durante la prueba
+    user_directory.ttl = 10 ** 9
+    expires_at = time.monotonic() + user_directory.ttl
+    for user_id in range(1, users + 1):
+        user_directory._store(user_id, f"user{user_id}", expires_at)
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, name: str, requests: int, concurrency: int, make_request, before=None) -> dict:
+    latencies = []
+    statuses = {}
+    sizes = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            if before:
+                await before()
+            start = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            sizes.append(len(response.content))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "avg_response_bytes": round(statistics.fmean(sizes)),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def build_scenarios(args, tokens: dict, category_ids: dict):
+    users = list(tokens)
+
+    def headers(i: int) -> dict:
+        return {"Authorization": f"Bearer {tokens[users[i % len(users)]]}"}
+
+    def get(path: str, params: dict = None):
+        return lambda client, i: client.get(path, params=params, headers=headers(i))
+
+    def post_transaction(client, i):
+        user_id = users[i % len(users)]
+        return client.post("/transactions/", headers=headers(i), json={
+            "user_id": user_id,
+            "category_id": str(category_ids[user_id][i % CATEGORIES_PER_USER]),
+            "amount": round(random.uniform(-500, 500), 2),
+            "description": "bench post",
+            "date": (START_DATE + timedelta(days=i % SPAN_DAYS)).replace(tzinfo=timezone.utc).isoformat(),
+        })
+
+    # Sin --warm-stats se invalida la caché de /stats antes de cada petición
+    cold = None if args.warm_stats else stats_cache.bump
+    return [
+        ("GET /transactions/", args.requests, get("/transactions/", {"limit": args.page_size}), None),
+        ("GET /transactions/export/csv", args.export_requests, get("/transactions/export/csv"), None),
+        ("GET /stats/by-user", args.requests, get("/stats/by-user"), cold),
+        ("GET /stats/by-category", args.requests, get("/stats/by-category"), cold),
+        ("GET /stats/over-time", args.requests, get("/stats/over-time"), cold),
+        ("GET /stats/timeseries", args.requests, get("/stats/timeseries", {"granularity": "month"}), cold),
+        ("GET /stats/dashboard", args.requests, get("/stats/dashboard"), cold),
+        ("POST /transactions/", args.requests, post_transaction, None),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, baseline_path: str) -> list:
+    """Diferencia de p95 y throughput frente a un JSON anterior (positivo = más lento)."""
+    with open(baseline_path) as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    diffs = []
+    for result in results:
+        old = baseline.get(result["scenario"])
+        if old:
+            diffs.append({
+                "scenario": result["scenario"],
+                "p95_change_pct": round((result["p95_ms"] / old["p95_ms"] - 1) * 100, 1),
+                "throughput_change_pct": round((result["throughput_rps"] / old["throughput_rps"] - 1) * 100, 1),
+            })
+    return diffs
+
+
+async def main(args):
+    category_ids = await seed(args.transactions, args.users, args.reuse, args.seed)
+    if args.postgres:
+        await user_directory.connect()
+    else:
+        preload_usernames(args.users)
+
+    tokens = {user_id: make_token(user_id) for user_id in range(1, args.users + 1)}
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, requests, make_request, before in build_scenarios(args, tokens, category_ids):
+            if requests <= 0:
+                continue
+            print(f"{name} ({requests} peticiones)...", file=sys.stderr)
+            results.append(await run_scenario(client, name, requests, args.concurrency, make_request, before))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "transactions": args.transactions,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "page_size": args.page_size,
+            "warm_stats": args.warm_stats,
+            "postgres": args.postgres,
+        },
+        "results": results,
+    }
+    if args.compare:
+        report["compare"] = {"baseline": args.compare, "diffs": compare(results, args.compare)}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    await user_directory.close()
+    if not args.keep:
+        await get_db().client.drop_database(get_db().name)
+    mongo.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pruebas de carga de la API de finanzas")
+    parser.add_argument("--transactions", type=int, default=1000, help="transacciones a sembrar (1000, 100000, 1000000...)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--export-requests", type=int, default=5, help="peticiones del export CSV")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100, help="limit de GET /transactions/")
+    parser.add_argument("--warm-stats", action="store_true", help="no invalidar la caché de /stats")
+    parser.add_argument("--postgres", action="store_true", help="usar Postgres real para los usernames")
+    parser.add_argument("--reuse", action="store_true", help="reutilizar los datos sembrados si coinciden")
+    parser.add_argument("--keep", action="store_true", help="no borrar la base de datos al terminar")
+    parser.add_argument("--seed", type=int, default=42, help="semilla de los datos generados")
+    parser.add_argument("--output", help="fichero JSON de resultados")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
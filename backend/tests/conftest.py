@@ -0,0 +1,31 @@
+# Tests sin servicios externos: Mongo en memoria (mongomock-motor) y sin Postgres.
+# Uso (desde backend/): python -m pytest -q tests
+import os
+
+for key, value in {
+    "JWT_SECRET": "test-secret", "mongo_user": "test", "mongo_password": "test",
+    "mongo_host": "localhost", "mongo_port": "27017", "db_name": "finanzas_test",
+    "MONGO_URI": "mongodb://localhost:27017",
+    "POSTGRES_HOST": "localhost", "POSTGRES_PORT": "5432", "POSTGRES_DATABASE": "test",
+    "POSTGRES_USER": "test", "POSTGRES_PASSWORD": "test",
+}.items():
+    os.environ.setdefault(key, value)
+
+import pytest  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from app.db import mongo  # noqa: E402
+from app.core.user_directory import user_directory  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongo.client = AsyncMongoMockClient()
+    mongo.db = mongo.client["finanzas_test"]
+
+    async def get_usernames(user_ids):
+        return {str(user_id): f"user{user_id}" for user_id in user_ids}
+
+    monkeypatch.setattr(user_directory, "get_usernames", get_usernames)
+    yield mongo.db
+    mongo.client = None
+    mongo.db = None
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+import pytest
+from app import crud
+
+USER = {"userId": 1, "role": "basic", "email": "user1@test.local"}
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    sent = []
+
+    async def notify(budget, start, spent, threshold):
+        sent.append((start, spent, threshold))
+
+    monkeypatch.setattr(crud, "notify_budget_alert", notify)
+    return sent
+
+
+async def setup_budget(db, limit=100):
+    category = await crud.create_category({"name": "Comida", "description": ""}, USER)
+    budget = await crud.create_budget(
+        {"category_id": str(category["_id"]), "period": "month", "limit": limit, "thresholds": [0.8, 1.0]}, USER
+    )
+    return category, budget
+
+
+async def add_expense(category, amount, day=1):
+    return await crud.create_transaction({
+        "category_id": str(category["_id"]), "amount": amount,
+        "description": "gasto", "date": datetime(2024, 5, day),
+    }, USER)
+
+
+def test_threshold_alerts_fire_once(db, alerts):
+    async def scenario():
+        category, budget = await setup_budget(db)
+        await add_expense(category, -90)
+        await add_expense(category, -10)
+        return await crud.get_budget_spending(budget, datetime(2024, 5, 15))
+
+    spending = asyncio.run(scenario())
+    assert spending["spent"] == 100
+    assert alerts == [(datetime(2024, 5, 1), 90, 0.8), (datetime(2024, 5, 1), 100, 1.0)]
+
+
+def test_description_only_edit_does_not_realert(db, alerts):
+    async def scenario():
+        category, budget = await setup_budget(db)
+        await add_expense(category, -90)
+        small = await add_expense(category, -10)
+        alerts.clear()
+        await crud.update_transaction(str(small["_id"]), {"description": "otro texto"}, USER)
+        counter = await crud.budget_spending_collection().find_one({"budget_id": budget["_id"]})
+        return counter
+
+    counter = asyncio.run(scenario())
+    assert alerts == []
+    assert counter["spent"] == 100
+    assert sorted(counter["alerted"]) == [0.8, 1.0]
+
+
+def test_lowering_spending_rearms_threshold(db, alerts):
+    async def scenario():
+        category, _ = await setup_budget(db)
+        await add_expense(category, -90)
+        small = await add_expense(category, -10)
+        await crud.update_transaction(str(small["_id"]), {"amount": -5}, USER)
+        alerts.clear()
+        await crud.update_transaction(str(small["_id"]), {"amount": -20}, USER)
+
+    asyncio.run(scenario())
+    assert alerts == [(datetime(2024, 5, 1), 110, 1.0)]
+
+
+def test_delete_subtracts_from_counter(db, alerts):
+    async def scenario():
+        category, budget = await setup_budget(db)
+        tx = await add_expense(category, -90)
+        await crud.delete_transaction(str(tx["_id"]), USER)
+        return await crud.get_budget_spending(budget, datetime(2024, 5, 15))
+
+    assert asyncio.run(scenario())["spent"] == 0
+
+
+def test_bulk_insert_counts_chunks_written_before_a_failure(db, alerts, monkeypatch):
+    monkeypatch.setattr(crud, "INSERT_CHUNK_SIZE", 2)
+    rolled_up = []
+
+    # mongomock no admite el bulk_write de UpdateOne de pymongo reciente
+    async def add_many_to_rollups(docs):
+        rolled_up.extend(docs)
+
+    monkeypatch.setattr(crud, "add_many_to_rollups", add_many_to_rollups)
+
+    async def scenario():
+        category, budget = await setup_budget(db, limit=1000)
+        docs = [
+            {"user_id": 1, "category_id": category["_id"], "amount": -10, "date": datetime(2024, 5, 1)}
+            for _ in range(4)
+        ]
+        collection = crud.transactions_collection()
+        real_insert_many = collection.insert_many
+        calls = []
+
+        async def flaky_insert_many(chunk, **kwargs):
+            calls.append(len(chunk))
+            if len(calls) == 2:
+                raise ConnectionError("red caída")
+            return await real_insert_many(chunk, **kwargs)
+
+        monkeypatch.setattr(type(collection), "insert_many", lambda self, chunk, **kw: flaky_insert_many(chunk, **kw))
+        with pytest.raises(ConnectionError):
+            await crud.insert_transactions_bulk(docs, USER)
+        return await crud.get_budget_spending(budget, datetime(2024, 5, 15))
+
+    spending = asyncio.run(scenario())
+    assert len(rolled_up) == 2
+    assert spending["spent"] == 20
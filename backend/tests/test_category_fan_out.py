@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+from app import crud
+
+USER = {"userId": 1, "role": "basic"}
+
+
+def test_update_without_name_change_does_not_fan_out(db, monkeypatch):
+    started = []
+    monkeypatch.setattr(crud, "run_in_background", lambda coro: started.append(coro) or coro.close())
+
+    async def scenario():
+        category = await crud.create_category({"name": "Ocio", "description": "a"}, USER)
+        await crud.update_category(str(category["_id"]), {"name": "Ocio", "description": "b"}, USER)
+        assert started == []
+        await crud.update_category(str(category["_id"]), {"name": "Cine", "description": "b"}, USER)
+        assert len(started) == 1
+
+    asyncio.run(scenario())
+
+
+def test_fan_out_pages_through_every_transaction(db, monkeypatch):
+    monkeypatch.setattr(crud, "FAN_OUT_BATCH_SIZE", 3)
+
+    async def scenario():
+        category = await crud.create_category({"name": "Ocio", "description": ""}, USER)
+        await crud.transactions_collection().insert_many([
+            {"user_id": 1, "category_id": category["_id"], "category_name": "Ocio",
+             "amount": -1, "date": datetime(2024, 5, 1)}
+            for _ in range(10)
+        ])
+        await crud.categories_collection().update_one({"_id": category["_id"]}, {"$set": {"name": "Cine"}})
+        await crud.fan_out_category_name(category["_id"], "Cine", 1)
+        return await crud.transactions_collection().distinct("category_name")
+
+    assert asyncio.run(scenario()) == ["Cine"]
+
+
+def test_name_filter_matches_substring_without_accents(db):
+    async def scenario():
+        await crud.create_category({"name": "Alimentación", "description": ""}, USER)
+        await crud.create_category({"name": "Gastos de alimentación", "description": ""}, USER)
+        await crud.create_category({"name": "Ocio", "description": ""}, USER)
+        query = crud.build_categories_query(USER, {"name": "MENTACI"})
+        return sorted([cat["name"] async for cat in crud.categories_collection().find(query)])
+
+    assert asyncio.run(scenario()) == ["Alimentación", "Gastos de alimentación"]
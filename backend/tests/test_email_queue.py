@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.utils.email_sender import EmailQueue, email_jobs_collection
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, msg):
+        self.sent.append(msg["Subject"])
+
+
+def test_job_status_is_visible_from_another_worker(db):
+    worker_a, worker_b = EmailQueue(max_size=5), EmailQueue(max_size=5)
+
+    async def scenario():
+        job_id = await worker_a.enqueue("user@test.local", "Informe", "<p>hola</p>")
+        queued = await worker_b.status(job_id)
+        _, msg = worker_a.queue.get_nowait()
+        await worker_a._deliver(FakeConnection(), job_id, msg)
+        return queued, await worker_b.status(job_id)
+
+    queued, sent = asyncio.run(scenario())
+    assert queued["status"] == "queued" and queued["to"] == "user@test.local"
+    assert sent["status"] == "sent" and sent["attempts"] == 1
+
+
+def test_full_queue_leaves_no_job(db):
+    queue = EmailQueue(max_size=1)
+
+    async def scenario():
+        await queue.enqueue("user@test.local", "1", "<p>1</p>")
+        with pytest.raises(HTTPException) as e:
+            await queue.enqueue("user@test.local", "2", "<p>2</p>")
+        assert e.value.status_code == 503
+        return await email_jobs_collection().count_documents({})
+
+    assert asyncio.run(scenario()) == 1
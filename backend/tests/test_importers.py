@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime
+import pytest
+from app.utils.importers import parse_csv, parse_ofx_date
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def collect(parser, data: bytes, size: int = 7):
+    async def run():
+        return [item async for item in parser(chunked(data, size))]
+    return asyncio.run(run())
+
+
+def test_csv_quoted_field_with_embedded_newline():
+    data = (
+        'category_id,amount,description,date\r\n'
+        'c1,-10.5,"COMPRA TARJETA\r\nSUPERMERCADO ""EL SOL""",2024-05-01\r\n'
+        '\r\n'
+        'c2,20,nómina,2024-05-02\r\n'
+    ).encode()
+    rows = collect(parse_csv, data)
+    assert rows == [
+        (1, {"category_id": "c1", "amount": "-10.5",
+             "description": 'COMPRA TARJETA\nSUPERMERCADO "EL SOL"', "date": "2024-05-01"}),
+        (2, {"category_id": "c2", "amount": "20", "description": "nómina", "date": "2024-05-02"}),
+    ]
+
+
+def test_csv_wrong_column_count_is_reported_per_row():
+    rows = collect(parse_csv, b"category_id,amount\nc1\nc2,5\n")
+    assert isinstance(rows[0][1], ValueError)
+    assert rows[1] == (2, {"category_id": "c2", "amount": "5"})
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("20240501", datetime(2024, 5, 1)),
+    ("202405011230", datetime(2024, 5, 1, 12, 30)),
+    ("20240501123045", datetime(2024, 5, 1, 12, 30, 45)),
+    ("20240501123045.123[-5:EST]", datetime(2024, 5, 1, 12, 30, 45)),
+])
+def test_ofx_date_forms(value, expected):
+    assert parse_ofx_date(value) == expected
+
+
+def test_ofx_date_rejects_partial_values():
+    with pytest.raises(ValueError):
+        parse_ofx_date("2024050")
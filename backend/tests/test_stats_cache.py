@@ -0,0 +1,49 @@
+import asyncio
+from app.core.stats_cache import StatsCache
+
+
+def test_versions_are_shared_between_workers(db):
+    worker_a, worker_b = StatsCache(), StatsCache()
+
+    async def scenario():
+        assert await worker_b.version("1") == (0, None)
+        await worker_a.bump(1)
+        await worker_a.bump(1)
+        user_version, modified_at = await worker_b.version("1")
+        global_version, _ = await worker_b.version("*")
+        other_version, _ = await worker_b.version("2")
+        return user_version, modified_at, global_version, other_version
+
+    user_version, modified_at, global_version, other_version = asyncio.run(scenario())
+    assert (user_version, global_version, other_version) == (2, 2, 0)
+    assert modified_at is not None
+    assert worker_a.etag(("1", "by-user", ()), 2) == worker_b.etag(("1", "by-user", ()), 2)
+
+
+def test_global_bump_invalidates_every_scope(db):
+    cache = StatsCache()
+
+    async def scenario():
+        await cache.bump(1)
+        before, _ = await cache.version("*")
+        await cache.bump()
+        return (await cache.version("1"))[0], before, (await cache.version("*"))[0]
+
+    user_version, before, after = asyncio.run(scenario())
+    assert user_version == 2
+    assert after > before
+
+
+def test_global_version_follows_any_user(db):
+    cache = StatsCache()
+
+    async def scenario():
+        await cache.bump(1)
+        first, _ = await cache.version("*")
+        await cache.bump(2)
+        second, modified_at = await cache.version("*")
+        return first, second, modified_at
+
+    first, second, modified_at = asyncio.run(scenario())
+    assert second > first
+    assert modified_at is not None
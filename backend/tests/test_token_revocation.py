@@ -0,0 +1,44 @@
+import asyncio
+import time
+import jwt
+import pytest
+from fastapi import HTTPException
+from app.core import auth
+
+
+def make_token(user_id: int = 1) -> str:
+    return jwt.encode(
+        {"userId": user_id, "role": "basic", "isApproved": True, "exp": int(time.time()) + 3600},
+        auth.JWT_SECRET, algorithm=auth.ALGORITHM,
+    )
+
+
+def test_revocation_from_another_worker_is_seen_after_cache_expiry(db, monkeypatch):
+    token = make_token()
+    digest = auth.token_cache.digest(token)
+
+    async def scenario():
+        assert (await auth.decode_token(token))["userId"] == 1
+        # Otro worker revoca: solo escribe en revoked_tokens (no en esta caché)
+        await auth.revoked_tokens_collection().insert_one({"_id": digest})
+        # Al caducar la entrada (max_age) se vuelve a consultar revoked_tokens
+        auth.token_cache._cache.pop(digest)
+        with pytest.raises(HTTPException) as e:
+            await auth.decode_token(token)
+        assert e.value.detail == "Token revocado"
+
+    asyncio.run(scenario())
+
+
+def test_revocation_event_drops_cached_claims(db):
+    token = make_token(2)
+    digest = auth.token_cache.digest(token)
+
+    async def scenario():
+        await auth.decode_token(token)
+        auth.invalidate_revoked_tokens({"collection": "revoked_tokens", "op": "insert",
+                                        "user_ids": set(), "document_id": digest})
+        with pytest.raises(HTTPException):
+            await auth.decode_token(token)
+
+    asyncio.run(scenario())
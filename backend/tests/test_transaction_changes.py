@@ -0,0 +1,37 @@
+import asyncio
+from datetime import datetime, timedelta
+from app import crud
+
+ADMIN = {"userId": 99, "role": "admin"}
+OWNER = {"userId": 1, "role": "basic"}
+NEW_OWNER = {"userId": 2, "role": "basic"}
+
+
+def settled(monkeypatch):
+    # Sin esperar CHANGES_SETTLE_SECONDS: el watermark pasa a ser "dentro de un minuto"
+    real = crud.change_time
+    monkeypatch.setattr(crud, "change_watermark", lambda: real() + timedelta(minutes=1))
+
+
+def test_moving_a_transaction_tombstones_it_for_the_previous_owner(db, monkeypatch):
+    settled(monkeypatch)
+
+    async def scenario():
+        category = await crud.create_category({"name": "Casa", "description": ""}, OWNER)
+        tx = await crud.create_transaction({
+            "category_id": str(category["_id"]), "amount": 10, "date": datetime(2024, 5, 1)
+        }, OWNER)
+        token = crud.encode_change_token(tx["updated_at"] - timedelta(seconds=1), crud.NO_ID)
+        await crud.update_transaction(str(tx["_id"]), {"user_id": 2}, ADMIN)
+        return (
+            tx,
+            await crud.get_transaction_changes(OWNER, token),
+            await crud.get_transaction_changes(NEW_OWNER, token),
+            await crud.get_transaction_changes(ADMIN, token),
+        )
+
+    tx, old_owner, new_owner, admin = asyncio.run(scenario())
+    assert old_owner[0] == [] and old_owner[1] == [str(tx["_id"])]
+    assert [t["_id"] for t in new_owner[0]] == [tx["_id"]] and new_owner[1] == []
+    # Para el admin sigue existiendo: no es un borrado
+    assert [t["_id"] for t in admin[0]] == [tx["_id"]] and admin[1] == []
@@ -0,0 +1,48 @@
+import asyncio
+from app.core import user_directory as module
+from app.core.user_directory import UserDirectory
+
+
+class FakePool:
+    async def fetch(self, query, ids):
+        return [{"id": user_id, "username": f"user{user_id}"} for user_id in ids]
+
+
+def test_pool_is_retried_after_a_failed_startup(monkeypatch):
+    attempts = []
+
+    async def create_pool(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise OSError("Postgres caído")
+        return FakePool()
+
+    monkeypatch.setattr(module.asyncpg, "create_pool", create_pool)
+    directory = UserDirectory(retry_interval=0)
+
+    async def scenario():
+        await directory.connect()
+        assert directory.pool is None
+        return await directory.get_usernames({7})
+
+    assert asyncio.run(scenario()) == {"7": "user7"}
+    assert len(attempts) == 2
+
+
+def test_retries_are_rate_limited(monkeypatch):
+    attempts = []
+
+    async def create_pool(**kwargs):
+        attempts.append(kwargs)
+        raise OSError("Postgres caído")
+
+    monkeypatch.setattr(module.asyncpg, "create_pool", create_pool)
+    directory = UserDirectory(retry_interval=60)
+
+    async def scenario():
+        await directory.connect()
+        assert await directory.get_usernames({1}) == {}
+        assert await directory.get_usernames({2}) == {}
+
+    asyncio.run(scenario())
+    assert len(attempts) == 1
@@ -15,3 +15,35 @@ export interface StatsOverTime {
   month: string; // "YYYY-MM"
   total: number;
 }
+
+// Resumen de /stats/dashboard (totales y las tres vistas en una petición)
+export interface StatsDashboardTotals {
+  count: number;
+  income: number;
+  expense: number; // en positivo
+  net: number;
+}
+
+export interface StatsDashboard {
+  totals: StatsDashboardTotals;
+  by_user: StatsByUser[];
+  by_category: StatsByCategory[];
+  over_time: { year: number; month: number; total: number }[];
+}
+
+// Serie temporal columnar de /stats/timeseries (timestamps en epoch ms)
+export interface StatsTimeSeriesCategory {
+  category_id: string;
+  category_name: string;
+  values: number[];
+  cumulative: number[];
+}
+
+export interface StatsTimeSeries {
+  granularity: 'day' | 'week' | 'month';
+  timezone: string;
+  timestamps: number[];
+  values?: number[];
+  cumulative?: number[];
+  series?: StatsTimeSeriesCategory[];
+}
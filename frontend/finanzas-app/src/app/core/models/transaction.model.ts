@@ -8,3 +8,11 @@ export interface Transaction {
   description?: string;
   date: Date;  
 }
+
+// Respuesta de /transactions/changes (sincronización incremental)
+export interface TransactionChanges {
+  changed: Transaction[];
+  deleted: string[];      // ids borrados
+  next_token: string;
+  has_more: boolean;
+}
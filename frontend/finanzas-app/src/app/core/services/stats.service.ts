@@ -1,8 +1,8 @@
 // src/app/core/services/stats.service.ts
-import { HttpClient } from '@angular/common/http';
+import { HttpClient, HttpParams } from '@angular/common/http';
 import { Injectable } from '@angular/core';
 import { Observable } from 'rxjs';
-import { StatsByUser, StatsByCategory, StatsOverTime } from '../models/stats.models';
+import { StatsByUser, StatsByCategory, StatsOverTime, StatsTimeSeries, StatsDashboard } from '../models/stats.models';
 import { environment } from '../../app.config';
 
 @Injectable({ providedIn: 'root' })
@@ -22,4 +22,27 @@ export class StatsService {
   getOverTime(): Observable<StatsOverTime[]> {
     return this.http.get<StatsOverTime[]>(`${this.baseUrl}/over-time`);
   }
+
+  getDashboard(options: { start?: string, end?: string } = {}): Observable<StatsDashboard> {
+    let params = new HttpParams();
+    if (options.start) params = params.set('start', options.start);
+    if (options.end) params = params.set('end', options.end);
+    return this.http.get<StatsDashboard>(`${this.baseUrl}/dashboard`, { params });
+  }
+
+  getTimeSeries(options: {
+    granularity?: 'day' | 'week' | 'month',
+    tz?: string,
+    start?: string,
+    end?: string,
+    by_category?: boolean
+  } = {}): Observable<StatsTimeSeries> {
+    let params = new HttpParams();
+    if (options.granularity) params = params.set('granularity', options.granularity);
+    if (options.tz) params = params.set('tz', options.tz);
+    if (options.start) params = params.set('start', options.start);
+    if (options.end) params = params.set('end', options.end);
+    if (options.by_category) params = params.set('by_category', 'true');
+    return this.http.get<StatsTimeSeries>(`${this.baseUrl}/timeseries`, { params });
+  }
 }
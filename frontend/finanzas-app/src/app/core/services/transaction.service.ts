@@ -1,8 +1,9 @@
 // frontend/finanzas-app/src/app/core/services/transaction.service.ts
 import { Injectable } from '@angular/core';
-import { HttpClient, HttpParams } from '@angular/common/http';
-import { Observable } from 'rxjs';
-import { Transaction } from '../models/transaction.model';
+import { HttpClient, HttpParams, HttpResponse } from '@angular/common/http';
+import { EMPTY, Observable } from 'rxjs';
+import { expand, map, reduce } from 'rxjs/operators';
+import { Transaction, TransactionChanges } from '../models/transaction.model';
 import { environment } from '../../app.config';
 
 @Injectable()
@@ -12,7 +13,31 @@ export class TransactionService {
   constructor(private http: HttpClient) { }
 
   getTransactions(): Observable<Transaction[]> {
-    return this.http.get<Transaction[]>(this.baseUrl);
+    return this.getAllPages(new HttpParams());
+  }
+
+  // El listado va paginado por cursor: se piden páginas con `after` mientras
+  // el backend devuelva X-Next-Cursor y se concatenan en una sola lista
+  private getAllPages(params: HttpParams): Observable<Transaction[]> {
+    const page = (after?: string) => this.http.get<Transaction[]>(this.baseUrl, {
+      params: after ? params.set('after', after) : params,
+      observe: 'response'
+    });
+    return page().pipe(
+      expand((response: HttpResponse<Transaction[]>) => {
+        const next = response.headers.get('X-Next-Cursor');
+        return next ? page(next) : EMPTY;
+      }),
+      map(response => response.body ?? []),
+      reduce((all, rows) => all.concat(rows), [] as Transaction[])
+    );
+  }
+
+  // Cambios desde el token de X-Change-Token (primera página del listado) o el next_token anterior
+  getChanges(since: string, limit?: number): Observable<TransactionChanges> {
+    let params = new HttpParams().set('since', since);
+    if (limit) params = params.set('limit', limit.toString());
+    return this.http.get<TransactionChanges>(`${this.baseUrl}changes`, { params });
   }
 
   getTransaction(id: string): Observable<Transaction> {
@@ -46,7 +71,7 @@ export class TransactionService {
       if (filters.end_date) params = params.set('end_date', filters.end_date);
     }
 
-    return this.http.get<Transaction[]>(this.baseUrl, { params });
+    return this.getAllPages(params);
   }
 
   exportCSV(filters?: any): Observable<Blob> {
@@ -65,8 +90,26 @@ export class TransactionService {
     });
   }
 
-  exportEmail(data: any): Observable<any> {
-    return this.http.post(`${this.baseUrl}export/email`, data);  // ← Enviar el objeto completo
+  exportEmail(filters?: any): Observable<any> {
+    // El backend genera el CSV y el resumen; solo se envían los filtros
+    let params = new HttpParams();
+
+    if (filters) {
+      if (filters.user_id) params = params.set('user_id', filters.user_id);
+      if (filters.category_id) params = params.set('category_id', filters.category_id);
+      if (filters.start_date) params = params.set('start_date', filters.start_date);
+      if (filters.end_date) params = params.set('end_date', filters.end_date);
+      if (filters.min_amount != null) params = params.set('min_amount', filters.min_amount);
+      if (filters.max_amount != null) params = params.set('max_amount', filters.max_amount);
+      for (const field of ['username', 'category_name', 'description']) {
+        if (filters[field]) {
+          params = params.set(field, filters[field]);
+          params = params.set(`${field}_mode`, filters[`${field}_mode`] || 'contains');
+        }
+      }
+    }
+
+    return this.http.post(`${this.baseUrl}export/email`, null, { params });
   }
 
 }
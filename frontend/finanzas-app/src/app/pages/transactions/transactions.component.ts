@@ -154,7 +154,8 @@ export class TransactionsComponent implements OnInit {
                 (this.filters.amount.max == null || tx.amount <= this.filters.amount.max);
             const dateMatch =
                 (!this.filters.date.start || (tx.date !== null && tx.date >= this.filters.date.start)) &&
-                (!this.filters.date.end || (tx.date !== null && tx.date <= this.filters.date.end));
+                // La fecha final (solo día) incluye todo ese día, como en el backend
+                (!this.filters.date.end || (tx.date !== null && String(tx.date).slice(0, 10) <= this.filters.date.end));
 
             return userMatch && catMatch && descMatch && amountMatch && dateMatch;
         });
@@ -537,24 +538,21 @@ export class TransactionsComponent implements OnInit {
 
     async exportEmail() {
         try {
-            const csvData = this.generateCSVFromData(this.filteredTransactions);
-
-            // Preparar datos para el resumen
-            const summaryData = this.filteredTransactions.map(tx => ({
-                username: tx.username,
-                category_name: tx.category_name,
-                cantidad: tx.amount,
-                description: tx.description,
-                fecha: tx.date                
-            }));
-
             await this.transactionService.exportEmail({
-                csv_data: csvData,
-                total_transactions: this.filteredTransactions.length,
-                summary_data: summaryData  // ← Enviar datos para resumen
+                start_date: this.filters.date.start,
+                end_date: this.filters.date.end,
+                min_amount: this.filters.amount.min,
+                max_amount: this.filters.amount.max,
+                // Mismos filtros de texto que la tabla (el backend los aplica igual)
+                username: this.filters.username.value,
+                username_mode: this.filters.username.mode,
+                category_name: this.filters.category_name.value,
+                category_name_mode: this.filters.category_name.mode,
+                description: this.filters.description.value,
+                description_mode: this.filters.description.mode
             }).toPromise();
 
-            alert(`📧 Email enviado con ${this.filteredTransactions.length} transacciones filtradas`);
+            alert('📧 Email en cola, recibirás el reporte en unos instantes');
             this.showExportMenu = false;
         } catch (error) {
             alert('❌ Error enviando email');